@@ -1,4 +1,4 @@
-import os
+import importlib
 import sys
 from pathlib import Path
 import click
@@ -19,9 +19,72 @@ SETTINGS_PATH = APP_DIR / "settings.json"
 state = {"verbose": False}
 out = Console()
 
-if not os.path.exists(APP_DIR):
-    os.makedirs(DEFAULT_DATA_DIR)
+#: Public names -> defining module (imported on first attribute access to keep startup fast)
+_EXPORTS = {
+    "iscc_eval.config": ("cnf",),
+    "iscc_eval.utils": (
+        "get_files",
+        "system_info",
+        "system_meta",
+        "cpu_info",
+        "download",
+        "file_checksum",
+        "iter_files",
+        "expand_paths",
+        "dirhash",
+        "legacy_dirhash",
+        "file_hash",
+        "stat_manifest",
+        "read_json",
+        "write_json",
+    ),
+    "iscc_eval.parallel": (
+        "CodeResult",
+        "opts_snapshot",
+        "opts_restore",
+        "code_file",
+        "code_files",
+    ),
+    "iscc_eval.discovery": ("Entry", "Manifest", "scan", "detect_mediatype"),
+    "iscc_eval.cache": ("code_cache", "cache_key", "cached_code", "cache_store", "truncate_code"),
+    "iscc_eval.profiling": ("STAGES", "StageProfiler"),
+    "iscc_eval.distractors": (
+        "DISTRACTOR_TYPES",
+        "random_codes",
+        "flip_distances",
+        "flip_codes",
+        "store_augment",
+    ),
+    "iscc_eval.memory": ("memory_supported", "memory_profile", "memory_summary", "memory_table"),
+    "iscc_eval.store": (
+        "GroundTruthStore",
+        "StoreWriter",
+        "store_convert",
+        "shard_of",
+        "store_merge",
+        "MatchSpill",
+        "iter_spill",
+    ),
+    "iscc_eval.history": (
+        "history_db",
+        "files_fingerprint",
+        "record",
+        "get_run",
+        "compare_runs",
+    ),
+    "iscc_eval.datasets.archive": ("ScratchArea", "ZipDataset"),
+    "iscc_eval.datasets.fma_small": ("fma_small",),
+}
+_LAZY = {name: module for module, names in _EXPORTS.items() for name in names}
 
-from iscc_eval.config import *
-from iscc_eval.utils import *
-from iscc_eval.datasets.fma_small import *
+
+def __getattr__(name):
+    if name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY))
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 """Create Transcoded Variations of audio files"""
 import os
+from concurrent.futures import ThreadPoolExecutor
 from os.path import splitext, basename, abspath, join
 from subprocess import run
+from time import perf_counter
+from typing import Iterable, List, NamedTuple, Optional
 import iscc_eval as ie
 from loguru import logger as log
 from pathlib import Path
@@ -20,40 +23,109 @@ target_formats = (
     "wv_64000",
 )
 
+#: File extension -> ffmpeg muxer (temp files have no media extension to infer it from)
+MUXERS = {"aif": "aiff", "mp2": "mp2", "mp3": "mp3", "aac": "adts"}
 
-def create_file_variations(fp, outpath):
-    """Builds/Caches/Returns a list of encoding variations for a given audio file"""
+
+class Transcode(NamedTuple):
+    """Single variation transcode job"""
+
+    src: str
+    dst: str
+    bitrate: str
+
+
+def file_jobs(fp, outpath):
+    # type: (str, str) -> List[Transcode]
+    """Transcode jobs for all target format variations of a given audio file"""
     in_name, in_ext = splitext(basename(fp))
-    variations = []
+    jobs = []
     for tf in target_formats:
         fmt, bitrate = tf.split("_")
         out_path = abspath(join(outpath, f"v_{in_name}-{bitrate}.{fmt}"))
-        # generate if it does not exist:
-        if not os.path.exists(out_path):
-            run([ffmpeg_bin(), "-i", fp, "-b:a", bitrate, out_path], check=True)
-        variations.append(out_path)
-    return variations
+        jobs.append(Transcode(str(fp), out_path, bitrate))
+    return jobs
+
+
+def is_complete(path):
+    # type: (str) -> bool
+    """Outputs are only ever renamed into place after ffmpeg succeeded"""
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+
+def transcode(job, ffmpeg=None):
+    # type: (Transcode, Optional[str]) -> bool
+    """Run transcode job via temp file and atomic rename (returns False if skipped)"""
+    if is_complete(job.dst):
+        return False
+    fmt = splitext(job.dst)[1].lstrip(".")
+    tmp_path = job.dst + ".part"
+    cmd = [ffmpeg or ffmpeg_bin(), "-nostdin", "-hide_banner", "-loglevel", "error", "-y"]
+    cmd += ["-i", job.src, "-b:a", job.bitrate, "-f", MUXERS.get(fmt, fmt), tmp_path]
+    try:
+        run(cmd, check=True)
+        os.replace(tmp_path, job.dst)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return True
+
+
+def run_jobs(jobs, concurrency=None):
+    # type: (Iterable[Transcode], Optional[int]) -> dict
+    """
+    Run transcode jobs concurrently (ffmpeg runs in subprocesses, so threads suffice).
+
+    :param jobs: Transcode jobs
+    :param concurrency: Maximum number of concurrent ffmpeg processes (default: cpu count)
+    :return: Number of transcoded and skipped jobs, elapsed seconds and transcodes per second
+    """
+    jobs = list(jobs)
+    # Temp files of an interrupted run are incomplete - remove them before resuming
+    for job in jobs:
+        if os.path.exists(job.dst + ".part"):
+            os.remove(job.dst + ".part")
+    concurrency = concurrency or os.cpu_count() or 1
+    ffmpeg = ffmpeg_bin()  # Resolve (and install) once before fanning out
+    start = perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        done = list(executor.map(lambda job: transcode(job, ffmpeg), jobs))
+    elapsed = perf_counter() - start
+    transcoded = sum(done)
+    rate = transcoded / elapsed if elapsed else 0.0
+    log.info(
+        f"Transcoded {transcoded} variations ({len(jobs) - transcoded} skipped) "
+        f"in {elapsed:.2f} s with concurrency {concurrency} - {rate:.2f} transcodes/s"
+    )
+    return dict(transcoded=transcoded, skipped=len(jobs) - transcoded, seconds=elapsed, rate=rate)
+
+
+def create_file_variations(fp, outpath, concurrency=None):
+    """Builds/Caches/Returns a list of encoding variations for a given audio file"""
+    jobs = file_jobs(fp, outpath)
+    run_jobs(jobs, concurrency)
+    return [job.dst for job in jobs]
 
 
-def create_dir_variations(src: Path, dst: Path) -> None:
+def create_dir_variations(src: Path, dst: Path, concurrency: Optional[int] = None) -> List[str]:
     total, files = ie.get_files(src, mode="audio")
     log.debug(
         f"Creating variatons for {len(files)} audio files with total size of {naturalsize(total)}"
     )
-    variations = []
+    jobs = []
     for file in files:
-        v = create_file_variations(file, dst)
-        variations.extend(v)
-    return variations
+        jobs.extend(file_jobs(file, dst))
+    run_jobs(jobs, concurrency)
+    return [job.dst for job in jobs]
 
 
-def sample():
+def sample(n_clusters=100, concurrency=None):
     import shutil
 
-    n_clusters = 100
     cluster_dir = ie.cnf.data_dir / "clusters"
     cluster_dir.mkdir(parents=True, exist_ok=True)
 
+    jobs = []
     for idx, fp in enumerate(ie.fma_small()):
         if idx > n_clusters:
             shutil.copy(fp, cluster_dir)
@@ -64,8 +136,9 @@ def sample():
         file_cluster_dir.mkdir(parents=True, exist_ok=True)
         # Copy source file to clusterdir
         shutil.copy(fp, file_cluster_dir)
-        # Create variations
-        create_file_variations(fp, file_cluster_dir)
+        # Transcode from the copy - scratch files may be evicted before the jobs run
+        jobs.extend(file_jobs(file_cluster_dir / fp.name, file_cluster_dir))
+    run_jobs(jobs, concurrency)
 
 
 if __name__ == "__main__":
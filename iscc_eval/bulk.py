@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Bulk hamming distance computation between lists of ISCC codes"""
+import struct
+import sys
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, TextIO, Tuple
+import numpy as np
+import iscc_core as ic
+from iscc_eval.hamming import distance_matrix, pack_codes
+
+
+__all__ = [
+    "read_codes",
+    "iter_tiles",
+    "iter_pairs",
+    "write_matrix",
+    "write_pairs",
+]
+
+#: Default number of query rows per distance tile
+BLOCK_SIZE = 256
+#: Default number of target columns per distance tile (keeps tiles cache resident)
+TILE_SIZE = 4096
+#: Memory budget in bytes for one row block of the dense distance matrix
+MATRIX_BUDGET = 2**26
+MATRIX_MAGIC = b"ISCCDM01"
+
+
+def read_codes(source):
+    # type: (Path) -> Tuple[List[str], np.ndarray]
+    """
+    Read ISCC codes (one per line) from file or stdin (`-`) and decode them once.
+
+    All codes must have the same header (MainType, SubType, Version and Length) as required
+    for `iscc_core.iscc_distance`.
+
+    :raises ValueError: For invalid codes or codes with differing headers
+    :return: Code strings as read and their packed hash digests
+    """
+    infile = sys.stdin if str(source) == "-" else open(source, "rt", encoding="utf-8")
+    codes, digests, header = [], [], None
+    try:
+        for lineno, line in enumerate(infile, 1):
+            code = line.strip()
+            if not code:
+                continue
+            try:
+                obj = ic.Code(code)
+            except ValueError as e:
+                raise ValueError(f"{source}:{lineno} invalid ISCC code {code} ({e})") from None
+            if header is None:
+                header = obj.maintype, obj.subtype, obj.version, obj.length
+            elif (obj.maintype, obj.subtype, obj.version, obj.length) != header:
+                raise ValueError(f"{source}:{lineno} {code} header differs from {codes[0]}")
+            codes.append(code)
+            digests.append(obj.hash_bytes)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+    return codes, pack_codes(digests)
+
+
+def iter_tiles(queries, targets, block_size=BLOCK_SIZE, tile_size=TILE_SIZE, upper=False):
+    # type: (np.ndarray, np.ndarray, int, int, bool) -> Iterator[Tuple[int, int, np.ndarray]]
+    """
+    Yield (query offset, target offset, distances) for tiles of the distance matrix.
+
+    :param upper: Skip tiles entirely below the diagonal (all-pairs of a single list)
+    """
+    for qoff in range(0, len(queries), block_size):
+        qblock = queries[qoff : qoff + block_size]
+        first = qoff - qoff % tile_size if upper else 0
+        for toff in range(first, len(targets), tile_size):
+            yield qoff, toff, distance_matrix(qblock, targets[toff : toff + tile_size])
+
+
+def iter_pairs(queries, targets=None, th=10, block_size=BLOCK_SIZE, tile_size=TILE_SIZE):
+    # type: (np.ndarray, Optional[np.ndarray], int, int, int) -> Iterator[Tuple[int, int, int]]
+    """
+    Yield (query index, target index, distance) for all pairs within distance `th`.
+
+    Without `targets` all unique pairs (i < j) of `queries` are compared.
+    """
+    upper = targets is None
+    targets = queries if upper else targets
+    for qoff, toff, dist in iter_tiles(queries, targets, block_size, tile_size, upper):
+        rows, cols = np.nonzero(dist <= th)
+        rows, cols = rows + qoff, cols + toff
+        if upper:
+            keep = rows < cols
+            rows, cols = rows[keep], cols[keep]
+        for i, j, d in zip(rows.tolist(), cols.tolist(), dist[rows - qoff, cols - toff].tolist()):
+            yield i, j, d
+
+
+def write_matrix(outfile, queries, targets=None, block_size=BLOCK_SIZE, tile_size=TILE_SIZE):
+    # type: (BinaryIO, np.ndarray, Optional[np.ndarray], int, int) -> None
+    """
+    Stream the dense distance matrix in row blocks to a binary file.
+
+    Format: magic `b"ISCCDM01"`, little endian uint32 rows and cols, then rows x cols little
+    endian uint16 distances in row-major order (readable with `np.memmap(offset=16)`).
+    """
+    targets = queries if targets is None else targets
+    outfile.write(MATRIX_MAGIC)
+    outfile.write(struct.pack("<II", len(queries), len(targets)))
+    rows = max(1, min(block_size, MATRIX_BUDGET // max(2 * len(targets), 1)))
+    for qoff in range(0, len(queries), rows):
+        qblock = queries[qoff : qoff + rows]
+        dist = np.empty((len(qblock), len(targets)), dtype="<u2")
+        for toff in range(0, len(targets), tile_size):
+            tile = targets[toff : toff + tile_size]
+            dist[:, toff : toff + tile_size] = distance_matrix(qblock, tile)
+        outfile.write(dist.tobytes())
+
+
+def write_pairs(outfile, pairs, query_codes, target_codes):
+    # type: (TextIO, Iterator[Tuple[int, int, int]], List[str], List[str]) -> int
+    """Write pairs as tab separated `query<TAB>target<TAB>distance` lines"""
+    count = 0
+    for i, j, d in pairs:
+        outfile.write(f"{query_codes[i]}\t{target_codes[j]}\t{d}\n")
+        count += 1
+    return count
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Persistent content-addressed cache for per-file ISCC codes"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Tuple
+import iscc_core as ic
+import iscc_sdk as idk
+from diskcache import Cache
+import iscc_eval as ie
+
+
+__all__ = [
+    "code_cache",
+    "cache_key",
+    "cached_code",
+    "cache_store",
+    "truncate_code",
+]
+
+#: Code generator name -> iscc-core option fields that determine the resulting code length
+BITS_OPTS = {
+    "code_instance": ("instance_bits",),
+    "code_data": ("data_bits",),
+    "code_meta": ("meta_bits",),
+    "code_content": ("text_bits", "image_bits", "audio_bits", "video_bits"),
+    "code_text": ("text_bits",),
+    "code_image": ("image_bits",),
+    "code_audio": ("audio_bits",),
+    "code_video": ("video_bits",),
+    "code_iscc": (
+        "meta_bits",
+        "text_bits",
+        "image_bits",
+        "audio_bits",
+        "video_bits",
+        "data_bits",
+        "instance_bits",
+    ),
+}
+
+#: Content-Code generators whose shorter codes are prefixes of their longest code (v0 algorithms)
+PREFIX_FUNCS = {"code_content", "code_text", "code_image", "code_audio", "code_video"}
+#: Longest Content-Code length in bits
+MAX_BITS = 256
+#: Content-Code subtype -> iscc-core option field for its code length
+SUBTYPE_OPTS = {
+    ic.ST_CC.TEXT: "text_bits",
+    ic.ST_CC.IMAGE: "image_bits",
+    ic.ST_CC.AUDIO: "audio_bits",
+    ic.ST_CC.VIDEO: "video_bits",
+}
+
+_cache = None  # type: Optional[Cache]
+
+
+def code_cache():
+    # type: () -> Cache
+    """Open (once per process) the size bounded code cache in the data directory"""
+    global _cache
+    if _cache is None:
+        _cache = Cache(
+            (ie.cnf.data_dir / "codecache").as_posix(),
+            size_limit=ie.cnf.cache_size,
+            eviction_policy="least-recently-used",
+        )
+    return _cache
+
+
+def cache_key(path, func, digest=None):
+    # type: (Path, Callable, Optional[str]) -> Tuple
+    """Cache key for code generator `func` applied to file content at `path`"""
+    name = func.__name__
+    bits = tuple(getattr(ic.core_opts, opt) for opt in BITS_OPTS.get(name, ()))
+    digest = digest or ie.file_hash(path)
+    return digest, name, bits, ic.__version__, idk.__version__
+
+
+@contextmanager
+def max_bits():
+    # type: () -> Iterator[None]
+    """Temporarily set all Content-Code lengths to `MAX_BITS`"""
+    previous = {opt: getattr(ic.core_opts, opt) for opt in SUBTYPE_OPTS.values()}
+    try:
+        for opt in previous:
+            setattr(ic.core_opts, opt, MAX_BITS)
+        yield
+    finally:
+        for opt, value in previous.items():
+            setattr(ic.core_opts, opt, value)
+
+
+def truncate_code(iscc, bits=None):
+    # type: (str, Optional[int]) -> str
+    """
+    Shorten Content-Code `iscc` to `bits` (default: the configured length for its subtype).
+
+    Shorter v0 Content-Codes are prefixes of longer codes for the same features, so truncation
+    yields the same code as generating it with the shorter length.
+    """
+    code = ic.Code(iscc)
+    bits = bits or getattr(ic.core_opts, SUBTYPE_OPTS[code.subtype])
+    if bits >= code.length:
+        return iscc
+    digest = code.hash_bytes[: bits // 8]
+    return "ISCC:" + ic.encode_component(code.maintype, code.subtype, code.version, bits, digest)
+
+
+def cached_code(path, func=idk.code_content):
+    # type: (Path, Callable) -> str
+    """
+    Return ISCC for `path` from cache or generate (and cache) it with `func`.
+
+    Content-Codes are generated and cached at their longest length and truncated to the
+    configured length, so all code lengths are served from a single decoding pass per file.
+    """
+    cache = code_cache()
+    digest = ie.file_hash(path)
+    if func.__name__ not in PREFIX_FUNCS:
+        key = cache_key(path, func, digest)
+        iscc = cache.get(key)
+        if iscc is None:
+            iscc = func(path.as_posix()).iscc
+            cache.set(key, iscc)
+        return iscc
+    with max_bits():
+        key = cache_key(path, func, digest)
+    iscc = cache.get(key)
+    if iscc is None:
+        # Entries added with `cache_store` for the configured length
+        iscc = cache.get(cache_key(path, func, digest))
+        if iscc is not None:
+            return iscc
+        with max_bits():
+            iscc = func(path.as_posix()).iscc
+        cache.set(key, iscc)
+    return truncate_code(iscc)
+
+
+def cache_store(path, func, iscc):
+    # type: (Path, Callable, str) -> None
+    """Add an already generated ISCC for `path` to the cache"""
+    code_cache().set(cache_key(path, func), iscc)
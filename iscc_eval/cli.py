@@ -1,13 +1,45 @@
 # -*- coding: utf-8 -*-
+import importlib
+import json
+import os
+import sys
 from pathlib import Path
+from time import perf_counter
+from typing import List, Optional
 import typer
-from iscc_eval import state, config, speed, match
+from typer.core import TyperGroup
+import iscc_eval as ie
+from iscc_eval import state
 from rich import print as rprint
-import iscc_sdk as idk
-import iscc_core as ic
+from rich.console import Console
 
 
-cli = typer.Typer(no_args_is_help=True)
+#: Subcommand groups -> modules with a typer `app` (imported only when the group is invoked)
+SUBCOMMANDS = {
+    "speed": "iscc_eval.speed",
+    "config": "iscc_eval.config",
+    "match": "iscc_eval.match",
+    "history": "iscc_eval.history",
+}
+
+
+class LazyGroup(TyperGroup):
+    """Command group that imports subcommand modules on demand for fast startup"""
+
+    def list_commands(self, ctx):
+        return sorted(super().list_commands(ctx) + list(SUBCOMMANDS))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in SUBCOMMANDS:
+            app = importlib.import_module(SUBCOMMANDS[cmd_name]).app
+            command = typer.main.get_command(app)
+            command.name = cmd_name
+            return command
+        return super().get_command(ctx, cmd_name)
+
+
+cli = typer.Typer(cls=LazyGroup, no_args_is_help=True)
+err = Console(stderr=True)
 
 
 @cli.callback()
@@ -19,30 +51,137 @@ def main(verbose: bool = False):
 
 @cli.command()
 def cc(
-    path: Path = typer.Argument(..., help="Path to file for Content-Code processing"),
+    paths: Optional[List[str]] = typer.Argument(
+        None, help="Files, directories (recursive) or glob patterns for Content-Code processing"
+    ),
     bits: int = typer.Option(64, help="Content-Code length in number of bits (64, 128, 256)"),
+    cache: bool = typer.Option(True, help="Reuse cached code for unchanged file content"),
+    files_from: Optional[Path] = typer.Option(
+        None, help="Read additional paths from file (one per line, - for stdin)."
+    ),
+    workers: int = typer.Option(1, help="Number of processes for code generation."),
+    out: Optional[Path] = typer.Option(
+        None, help="Append JSONL results to file (files already in it are skipped)."
+    ),
 ):
-    """Generate Content-Code for File"""
+    """Generate Content-Code for File (or JSONL results for many files)"""
+    import iscc_core as ic
+    import iscc_sdk as idk
+
     idk.sdk_opts.extract_metadata = False
     ic.core_opts.audio_bits = bits
     ic.core_opts.image_bits = bits
     ic.core_opts.text_bits = bits
     ic.core_opts.video_bits = bits
     assert bits in (64, 128, 256)
-    iscc_meta = idk.code_content(path.as_posix())
-    print(iscc_meta.iscc)
+    paths = paths or []
+    single = len(paths) == 1 and os.path.isfile(paths[0]) and not (files_from or out)
+    if single:
+        path = Path(paths[0])
+        if cache:
+            print(ie.cached_code(path, idk.code_content))
+        else:
+            print(idk.code_content(path.as_posix()).iscc)
+        return
+    if not paths and files_from is None:
+        raise typer.BadParameter("Provide paths or --files-from")
+
+    done = set()
+    if out is not None and out.exists():
+        with open(out, "r+b") as infile:
+            data = infile.read()
+            # Drop truncated last line of an interrupted run
+            infile.truncate(data.rfind(b"\n") + 1)
+        for line in data.splitlines()[: data.count(b"\n")]:
+            record = json.loads(line)
+            if record.get("iscc"):
+                done.add(record["path"])
+
+    def pending():
+        # Overlapping inputs (e.g. a directory and a file in it) are coded once
+        seen = set()
+        for fp in ie.expand_paths(paths, files_from):
+            fp = fp.resolve()
+            if fp not in seen and fp.as_posix() not in done:
+                seen.add(fp)
+                yield fp
+
+    todo = pending()
+    outf = open(out, "at", encoding="utf-8") if out else sys.stdout
+    coded, failed, start = 0, 0, perf_counter()
+    try:
+        for result in ie.code_files(todo, workers=workers, cache=cache):
+            record = dict(
+                path=result.path.as_posix(),
+                iscc=result.iscc,
+                size=result.path.stat().st_size if result.path.exists() else None,
+                elapsed=round(result.elapsed, 6),
+            )
+            if result.error is not None:
+                record["error"] = result.error
+                failed += 1
+            else:
+                coded += 1
+            outf.write(json.dumps(record) + "\n")
+            outf.flush()
+    finally:
+        if out:
+            outf.close()
+    elapsed = perf_counter() - start
+    err.print(f"Coded {coded} files ({failed} failed, {len(done)} already done) in {elapsed:.2f} s")
 
 
 @cli.command()
-def distance(a: str, b: str):
-    """Calculate distance between ISCC-CODES A and B"""
-    dist = ic.iscc_distance(a, b)
-    print(dist)
+def distance(
+    a: Optional[str] = typer.Argument(None, help="ISCC-CODE A"),
+    b: Optional[str] = typer.Argument(None, help="ISCC-CODE B"),
+    queries: Optional[Path] = typer.Option(
+        None, help="File with ISCC-CODES (one per line, - for stdin) for bulk mode."
+    ),
+    targets: Optional[Path] = typer.Option(
+        None, help="File with target ISCC-CODES (default: all pairs of queries)."
+    ),
+    th: int = typer.Option(10, help="Only output pairs within this distance (bulk mode)."),
+    matrix: Optional[Path] = typer.Option(
+        None, help="Write dense uint16 distance matrix to binary file (- for stdout) instead."
+    ),
+):
+    """Calculate distance between ISCC-CODES A and B (or in bulk between code lists)"""
+    if queries is None:
+        import iscc_core as ic
 
+        if a is None or b is None:
+            raise typer.BadParameter("Provide ISCC-CODES A and B or --queries for bulk mode")
+        dist = ic.iscc_distance(a, b)
+        print(dist)
+        return
+    from iscc_eval import bulk
 
-cli.add_typer(speed.app, name="speed")
-cli.add_typer(config.app, name="config")
-cli.add_typer(match.app, name="match")
+    try:
+        query_codes, packed_queries = bulk.read_codes(queries)
+    except ValueError as e:
+        raise typer.BadParameter(f"Invalid queries: {e}")
+    if not query_codes:
+        raise typer.BadParameter(f"No ISCC-CODES found in queries {queries}")
+    target_codes, packed_targets = query_codes, None
+    if targets is not None:
+        try:
+            target_codes, packed_targets = bulk.read_codes(targets)
+        except ValueError as e:
+            raise typer.BadParameter(f"Invalid targets: {e}")
+        if not target_codes:
+            raise typer.BadParameter(f"No ISCC-CODES found in targets {targets}")
+        if packed_targets.shape[1:] != packed_queries.shape[1:]:
+            raise typer.BadParameter("Query and target codes must have the same length")
+    if matrix is not None:
+        if str(matrix) == "-":
+            bulk.write_matrix(sys.stdout.buffer, packed_queries, packed_targets)
+        else:
+            with open(matrix, "wb") as outf:
+                bulk.write_matrix(outf, packed_queries, packed_targets)
+        return
+    pairs = bulk.iter_pairs(packed_queries, packed_targets, th)
+    bulk.write_pairs(sys.stdout, pairs, query_codes, target_codes)
 
 
 if __name__ == "__main__":
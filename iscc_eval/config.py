@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import json
+import os
 from pathlib import Path
 from typing import Optional
 from rich import print
@@ -23,6 +24,10 @@ class IsccEvalSettings(BaseSettings):
     data_dir: DirectoryPath = Field(
         ie.DEFAULT_DATA_DIR, description="Root directory for evaluation data"
     )
+    cache_size: int = Field(2**30, description="Maximum size of the ISCC code cache in bytes")
+    scratch_size: int = Field(
+        2**30, description="Maximum size of media extracted from dataset archives in bytes"
+    )
 
     def save(self):
         """Save settings"""
@@ -42,6 +47,8 @@ class IsccEvalSettings(BaseSettings):
 
 cnf: Optional[IsccEvalSettings] = None
 
+if not os.path.exists(ie.APP_DIR):
+    os.makedirs(ie.DEFAULT_DATA_DIR)
 
 try:
     IsccEvalSettings.load()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Lazy access to dataset media inside zip archives (no full extraction)"""
+import os
+import shutil
+import threading
+import zipfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import IO, Iterable, Iterator, Optional
+from loguru import logger as log
+
+
+__all__ = [
+    "ScratchArea",
+    "ZipDataset",
+]
+
+
+class ScratchArea:
+    """
+    Size bounded directory of extracted files with least-recently-used eviction.
+
+    :param path: Scratch directory (files already present are reused)
+    :param size_limit: Maximum total size of files in bytes
+    """
+
+    def __init__(self, path, size_limit):
+        # type: (Path, int) -> None
+        self.path = Path(path)
+        self.size_limit = size_limit
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.entries = OrderedDict()  # Relative name -> size in least-recently-used order
+        self.lock = threading.Lock()
+        files = [p for p in self.path.rglob("*") if p.is_file() and p.suffix != ".tmp"]
+        for fp in sorted(files, key=lambda p: p.stat().st_mtime_ns):
+            self.entries[fp.relative_to(self.path).as_posix()] = fp.stat().st_size
+
+    @property
+    def size(self):
+        # type: () -> int
+        return sum(self.entries.values())
+
+    def get(self, name):
+        # type: (str) -> Optional[Path]
+        """Path of scratch file `name` if present (marks it as recently used)"""
+        with self.lock:
+            if name not in self.entries:
+                return None
+            self.entries.move_to_end(name)
+        fp = self.path / name
+        os.utime(fp)
+        return fp
+
+    def put(self, name, stream):
+        # type: (str, IO[bytes]) -> Path
+        """Store `stream` as scratch file `name` (via temp file + atomic rename)"""
+        fp = self.path / name
+        fp.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = fp.with_name(fp.name + f".{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as outf:
+            shutil.copyfileobj(stream, outf, 2**20)
+        os.replace(tmp_path, fp)
+        with self.lock:
+            self.entries[name] = fp.stat().st_size
+            self.entries.move_to_end(name)
+            self._evict(keep=name)
+        return fp
+
+    def _evict(self, keep):
+        # type: (str) -> None
+        total = self.size
+        while total > self.size_limit and len(self.entries) > 1:
+            name, size = next(iter(self.entries.items()))
+            if name == keep:
+                break
+            del self.entries[name]
+            (self.path / name).unlink(missing_ok=True)
+            log.debug(f"Evicted {name} from scratch area {self.path}")
+            total -= size
+
+
+class ZipDataset:
+    """
+    Dataset media inside a zip archive.
+
+    Members are enumerated from the central directory only. Media can be streamed directly
+    (`open`) or extracted on demand (`extract`) into a bounded `ScratchArea` for tools that
+    need a file path (e.g. ffmpeg based code generation).
+
+    :param path: Zip archive
+    :param scratch: Scratch directory for extracted members
+    :param size_limit: Maximum size of extracted members kept in the scratch directory
+    """
+
+    def __init__(self, path, scratch, size_limit=2**30):
+        # type: (Path, Path, int) -> None
+        self.path = Path(path)
+        self.zip = zipfile.ZipFile(self.path)
+        self.scratch = ScratchArea(scratch, size_limit)
+
+    def members(self, exts=None):
+        # type: (Optional[Iterable[str]]) -> Iterator[zipfile.ZipInfo]
+        """Iterate over file members (optionally filtered by file extensions)"""
+        exts = None if exts is None else {x.lower().lstrip(".") for x in exts}
+        for info in self.zip.infolist():
+            if info.is_dir():
+                continue
+            ext = os.path.splitext(info.filename)[-1].lstrip(".").lower()
+            if exts is None or ext in exts:
+                yield info
+
+    def open(self, member):
+        # type: (zipfile.ZipInfo) -> IO[bytes]
+        """Stream bytes of archive `member` without extraction"""
+        return self.zip.open(member)
+
+    def extract(self, member):
+        # type: (zipfile.ZipInfo) -> Path
+        """File path of archive `member` (extracted to the scratch area if not present)"""
+        fp = self.scratch.get(member.filename)
+        if fp is None:
+            with self.open(member) as stream:
+                fp = self.scratch.put(member.filename, stream)
+        return fp
+
+    def close(self):
+        self.zip.close()
@@ -7,11 +7,11 @@ Info: https://github.com/mdeff/fma
 Data: https://os.unil.cloud.switch.ch/fma/fma_small.zip
 
 Instructions:
-    First iteration over fma_small will download and extract audio files.
+    First iteration over fma_small will download the archive. Audio files are extracted on
+    demand into a size bounded scratch area (see `scratch_size` setting).
 """
 import os
 from loguru import logger as log
-import zipfile
 import iscc_eval as ie
 from blake3 import blake3
 
@@ -19,8 +19,10 @@ from blake3 import blake3
 __all__ = ["fma_small"]
 
 DOWNLOAD_URL = "https://os.unil.cloud.switch.ch/fma/fma_small.zip"
+DOWNLOAD_CHECKSUM = "sha1:ade154f733639d52e35e32f5593efe5be76c6d70"
 DATA_PATH = os.path.join(ie.cnf.data_dir, "fma_small")
 DATA_FILE_PATH = os.path.join(DATA_PATH, "fma_small.zip")
+SCRATCH_PATH = os.path.join(DATA_PATH, "scratch")
 
 
 def fma_small():
@@ -33,14 +35,14 @@ def fma_small():
 
     if not os.path.exists(DATA_FILE_PATH):
         log.info("Downloading fma_small data: {}".format(DATA_FILE_PATH))
-        ie.download(DOWNLOAD_URL, DATA_FILE_PATH)
+        ie.download(DOWNLOAD_URL, DATA_FILE_PATH, checksum=DOWNLOAD_CHECKSUM)
 
-        log.info("Unpacking audio tracks: {}".format(DATA_FILE_PATH))
-        with zipfile.ZipFile(DATA_FILE_PATH) as zf:
-            zf.extractall(DATA_PATH)
-
-    for fp in ie.iter_files(DATA_PATH, exts=["mp3"], recursive=True):
-        yield fp
+    archive = ie.ZipDataset(DATA_FILE_PATH, SCRATCH_PATH, ie.cnf.scratch_size)
+    try:
+        for member in archive.members(exts=["mp3"]):
+            yield archive.extract(member).as_posix()
+    finally:
+        archive.close()
 
 
 if __name__ == "__main__":
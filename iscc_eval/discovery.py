@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Single pass dataset discovery.
+
+A `Manifest` is built from one `os.scandir` walk over a dataset directory and records path, size,
+mtime, inode and cluster membership per file. Mediatypes and perceptual modes are detected on
+demand: from the file extension where it is unambiguous and by parallel content sniffing
+otherwise. Detected mediatypes are persisted in the data directory and reused while file stat data
+is unchanged, so repeated runs on network filesystems touch each file's metadata only once.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+import blake3
+import iscc_sdk as idk
+from loguru import logger as log
+import iscc_eval as ie
+
+
+__all__ = [
+    "Entry",
+    "Manifest",
+    "scan",
+    "detect_mediatype",
+]
+
+
+#: Suffix of incomplete outputs (e.g. interrupted transcodes) that are never dataset files
+PARTIAL_SUFFIX = ".part"
+
+
+class Entry(NamedTuple):
+    """Discovered file"""
+
+    path: Path
+    rel: str  # Posix path relative to the dataset root
+    size: int
+    mtime_ns: int
+    inode: int
+    cluster: Optional[str]  # Cluster folder name, "" for top-level samples, None if nested deeper
+    mediatype: Optional[str] = None
+    mode: Optional[str] = None
+
+
+@lru_cache(maxsize=None)
+def _ext_mediatype(ext):
+    # type: (str) -> Optional[Tuple[str, str]]
+    """Mediatype and mode for a file extension if it is unambiguous without content sniffing"""
+    mediatype = idk.mediatype_normalize(idk.mediatype_from_name(f"file{ext}"))
+    entry = idk.SUPPORTED_MEDIATYPES.get(mediatype)
+    # Ogg containers are told apart (audio/video) by content sniffing in iscc-sdk
+    if entry is None or "ogg" in mediatype:
+        return None
+    return mediatype, entry["mode"]
+
+
+def detect_mediatype(path):
+    # type: (Path) -> Tuple[Optional[str], Optional[str]]
+    """
+    Mediatype and perceptual mode of `path` (None for unsupported or unreadable files).
+
+    Supported file extensions are trusted (fast path). Other files are sniffed by content.
+    """
+    fast = _ext_mediatype(path.suffix.lower())
+    if fast is not None:
+        return fast
+    try:
+        return idk.mediatype_and_mode(path.as_posix())
+    except (idk.IsccUnsupportedMediatype, OSError) as e:
+        log.debug(f"Unsupported mediatype for {path.name}: {e}")
+        return None, None
+
+
+def _walk(root, recursive=True):
+    # type: (str, bool) -> Iterator[Tuple[str, os.DirEntry]]
+    """Yield (relative posix path, DirEntry) for all regular files below `root` (except partials)"""
+    stack = [("", root)]
+    while stack:
+        prefix, directory = stack.pop()
+        with os.scandir(directory) as it:
+            for entry in it:
+                rel = prefix + entry.name
+                if entry.is_dir():
+                    if recursive:
+                        stack.append((rel + "/", entry.path))
+                elif entry.is_file() and not entry.name.endswith(PARTIAL_SUFFIX):
+                    yield rel, entry
+
+
+def scan(root, recursive=True):
+    # type: (Path, bool) -> Manifest
+    """Build a `Manifest` of all files below `root` with a single directory walk"""
+    root = Path(root)
+    entries = []
+    for rel, entry in _walk(root.as_posix(), recursive):
+        st = entry.stat()
+        parts = rel.split("/")
+        cluster = "" if len(parts) == 1 else parts[0] if len(parts) == 2 else None
+        entries.append(Entry(root / rel, rel, st.st_size, st.st_mtime_ns, st.st_ino, cluster))
+    entries.sort(key=lambda e: e.rel)
+    return Manifest(root, entries)
+
+
+class Manifest:
+    """Files of a dataset directory with stat data, cluster membership and mediatypes"""
+
+    def __init__(self, root, entries):
+        # type: (Path, List[Entry]) -> None
+        self.root = Path(root)
+        self.entries = entries
+        self.sniffed = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        # type: () -> Iterator[Entry]
+        return iter(self.entries)
+
+    @property
+    def total(self):
+        # type: () -> int
+        """Total size of all files in bytes"""
+        return sum(e.size for e in self.entries)
+
+    @property
+    def paths(self):
+        # type: () -> List[Path]
+        return [e.path for e in self.entries]
+
+    def stat_manifest(self):
+        # type: () -> Dict[str, list]
+        """Stat data in the format of `iscc_eval.utils.stat_manifest` (for `dirhash`)"""
+        return {e.rel: [e.size, e.mtime_ns, e.inode] for e in self.entries}
+
+    def clusters(self):
+        # type: () -> Dict[str, List[Path]]
+        """Cluster folder name -> sorted file paths (the first file is the query)"""
+        clusters = {}  # type: Dict[str, List[Path]]
+        for e in self.entries:
+            if e.cluster:
+                clusters.setdefault(e.cluster, []).append(e.path)
+        return clusters
+
+    def samples(self):
+        # type: () -> List[Path]
+        """Sorted top-level files"""
+        return [e.path for e in self.entries if e.cluster == ""]
+
+    def _types_path(self):
+        # type: () -> Path
+        key = blake3.blake3(self.root.resolve().as_posix().encode("utf-8")).hexdigest()[:16]
+        return Path(ie.cnf.data_dir) / "manifests" / f"{key}.types.json"
+
+    def sniff(self, workers=None):
+        # type: (Optional[int]) -> Manifest
+        """
+        Detect mediatype and mode for all entries (in place).
+
+        Results of previous runs are reused for files with unchanged stat data. Remaining files
+        are detected in parallel threads (default: cpu count).
+        """
+        if self.sniffed:
+            return self
+        types_path = self._types_path()
+        previous = ie.read_json(types_path)
+        detected = {}
+        stale = []
+        for e in self.entries:
+            old = previous.get(e.rel)
+            if old and old[:2] == [e.size, e.mtime_ns]:
+                detected[e.rel] = tuple(old[2:])
+            else:
+                stale.append(e)
+        if stale:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(detect_mediatype, (e.path for e in stale))
+                for e, result in zip(stale, results):
+                    detected[e.rel] = result
+        self.entries = [
+            e._replace(mediatype=detected[e.rel][0], mode=detected[e.rel][1]) for e in self.entries
+        ]
+        self.sniffed = True
+        types = {e.rel: [e.size, e.mtime_ns, e.mediatype, e.mode] for e in self.entries}
+        ie.write_json(types_path, types)
+        return self
+
+    def files(self, mode=None):
+        # type: (Optional[str]) -> List[Path]
+        """Paths of all files (or only files of perceptual `mode`)"""
+        if mode is None:
+            return self.paths
+        return [e.path for e in self.sniff().entries if e.mode == mode]
+
+    def detect_mode(self):
+        # type: () -> Tuple[Optional[str], Optional[Entry]]
+        """Perceptual mode of the first supported file (without sniffing the whole dataset)"""
+        for e in self.entries:
+            mode = e.mode if self.sniffed else detect_mediatype(e.path)[1]
+            if mode is not None:
+                return mode, e
+        return None, None
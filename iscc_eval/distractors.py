@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic distractor codes for scaling matching benchmarks.
+
+Distractors are hash digests that belong to no cluster. They are appended to the samples of a
+ground truth store to measure how precision and matching cost degrade with corpus size. Two kinds
+are generated with vectorized array operations:
+
+- `random`: uniformly random digests (unrelated content)
+- `flip`: real dataset codes with an exact number of flipped bits per distractor, drawn from a
+  configurable distance distribution (near-duplicates of content that is not a variation)
+"""
+import os
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import iscc_eval as ie
+
+
+__all__ = [
+    "DISTRACTOR_TYPES",
+    "random_codes",
+    "flip_distances",
+    "flip_codes",
+    "store_augment",
+]
+
+DISTRACTOR_TYPES = ("random", "flip")
+#: Number of distractors generated per vectorized chunk (bounds temporary memory)
+CHUNK_SIZE = 2**16
+
+
+def random_codes(count, bits, seed=0):
+    # type: (int, int, int) -> np.ndarray
+    """Uniformly random hash digests of shape (count, bits // 8)"""
+    rng = np.random.default_rng(seed)
+    return np.frombuffer(rng.bytes(count * bits // 8), dtype=np.uint8).reshape(count, bits // 8)
+
+
+def flip_distances(spec, count, bits, rng):
+    # type: (str, int, int, np.random.Generator) -> np.ndarray
+    """
+    Draw `count` bit flip counts from the distribution given by `spec`.
+
+    :param spec: `N` (fixed), `LOW-HIGH` (uniform, inclusive) or `normal:MEAN,STD` (rounded)
+    :return: Distances clipped to 0 to `bits`
+    """
+    try:
+        if spec.startswith("normal:"):
+            mean, std = (float(v) for v in spec[len("normal:") :].split(","))
+            dist = np.rint(rng.normal(mean, std, count))
+        elif "-" in spec:
+            low, high = (int(v) for v in spec.split("-"))
+            if low > high:
+                raise ValueError
+            dist = rng.integers(low, high + 1, count)
+        else:
+            dist = np.full(count, int(spec))
+    except ValueError:
+        raise ValueError(
+            f"Invalid distance distribution {spec} (use N, LOW-HIGH or normal:MEAN,STD)"
+        ) from None
+    return np.clip(dist, 0, bits).astype(np.int64)
+
+
+def flip_codes(codes, count, spec, seed=0):
+    # type: (np.ndarray, int, str, int) -> np.ndarray
+    """
+    Perturb randomly chosen rows of `codes` (n, nbytes) by flipping bits at random positions.
+
+    Every distractor has exactly the hamming distance drawn with `flip_distances` to its source
+    code (distinct bit positions per row).
+    """
+    if len(codes) == 0:
+        raise ValueError("No codes to perturb")
+    rng = np.random.default_rng(seed)
+    bits = codes.shape[1] * 8
+    source = rng.integers(0, len(codes), count)
+    dist = flip_distances(spec, count, bits, rng)
+    result = np.asarray(codes)[source]
+    for offset in range(0, count, CHUNK_SIZE):
+        chunk = slice(offset, offset + CHUNK_SIZE)
+        d = dist[chunk]
+        rows = np.arange(len(d))
+        flips = np.zeros((len(d), bits), dtype=bool)
+        # Floyd's sampling of `d` distinct bit positions per row - one step for all rows at once
+        for step in range(int(d.max(initial=0))):
+            active = rows[step < d]
+            top = bits - d[active] + step
+            pos = (rng.random(len(active)) * (top + 1)).astype(np.int64)
+            pos = np.where(flips[active, pos], top, pos)
+            flips[active, pos] = True
+        result[chunk] ^= np.packbits(flips, axis=1)
+    return result
+
+
+def store_augment(gdb, distractors, out_path=None):
+    # type: (ie.GroundTruthStore, np.ndarray, Optional[Path]) -> ie.GroundTruthStore
+    """
+    Copy of ground truth store `gdb` with `distractors` appended to its samples.
+
+    Original rows keep their sample indices - distractors follow the original samples.
+
+    :param out_path: Store file to write (default: next to `gdb` with a `_distractors` suffix)
+    """
+    if out_path is None:
+        out_path = gdb.path.with_name(f"{gdb.path.stem}_distractors_{os.getpid()}.gt")
+    meta = {k: gdb.header[k] for k in ("dataset", "fingerprint") if k in gdb.header}
+    writer = ie.StoreWriter(out_path, gdb.mode, gdb.bits, distractors=len(distractors), **meta)
+    writer.clusters.extend(gdb.clusters)
+    writer.extend(gdb.codes, np.asarray(gdb.cluster), np.asarray(gdb.query))
+    count = len(distractors)
+    writer.extend(distractors, np.full(count, -1, dtype=np.int32), np.zeros(count, dtype=bool))
+    return writer.close()
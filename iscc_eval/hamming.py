@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Vectorized hamming distance computation on packed ISCC hash digests"""
+from time import perf_counter
+from typing import Iterator, List, Sequence, Tuple, Union
+import numpy as np
+
+
+__all__ = [
+    "pack_codes",
+    "popcount",
+    "distance_matrix",
+    "iter_distance_blocks",
+    "as_packed",
+    "HammingMatcher",
+]
+
+#: Number of query rows per distance block (bounds temporary memory to block x samples)
+BLOCK_SIZE = 64
+#: Number of sample columns per distance tile for large sample sets (bounds temporary memory)
+TILE_SIZE = 2**16
+
+
+def pack_codes(codes):
+    # type: (Sequence[bytes]) -> np.ndarray
+    """
+    Pack equal length hash digests into a 2D `uint64` matrix (one row per code).
+
+    :param codes: Hash digests of 8, 16 or 32 bytes length
+    :return: Matrix of shape (len(codes), nbytes // 8)
+    """
+    if len(codes) == 0:
+        return np.zeros((0, 0), dtype=np.uint64)
+    nbytes = len(codes[0])
+    if nbytes % 8:
+        raise ValueError(f"Hash digest length must be a multiple of 8 bytes (got {nbytes})")
+    buffer = b"".join(codes)
+    if len(buffer) != nbytes * len(codes):
+        raise AssertionError("Hash digests of unequal length")
+    return np.frombuffer(buffer, dtype=np.uint64).reshape(len(codes), nbytes // 8)
+
+
+def _popcount_swar(arr):
+    # type: (np.ndarray) -> np.ndarray
+    """Population count for `uint64` arrays (SWAR fallback for numpy < 2.0)"""
+    arr = arr - ((arr >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    mask = np.uint64(0x3333333333333333)
+    arr = (arr & mask) + ((arr >> np.uint64(2)) & mask)
+    arr = (arr + (arr >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (arr * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+def popcount(arr):
+    # type: (np.ndarray) -> np.ndarray
+    """Number of set bits per element of a `uint64` array"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(arr)
+    return _popcount_swar(arr)
+
+
+def distance_matrix(queries, samples):
+    # type: (np.ndarray, np.ndarray) -> np.ndarray
+    """
+    Calculate hamming distances between all packed `queries` and `samples`.
+
+    :param queries: Packed codes of shape (q, words)
+    :param samples: Packed codes of shape (s, words)
+    :return: Distances of shape (q, s) as `uint16`
+    """
+    dist = np.zeros((queries.shape[0], samples.shape[0]), dtype=np.uint16)
+    for word in range(queries.shape[1]):
+        xor = np.bitwise_xor(queries[:, word, None], samples[None, :, word])
+        dist += popcount(xor).astype(np.uint16)
+    return dist
+
+
+def iter_distance_blocks(queries, samples, block_size=BLOCK_SIZE):
+    # type: (np.ndarray, np.ndarray, int) -> Iterator[Tuple[int, np.ndarray]]
+    """Yield (offset, distances) for consecutive blocks of `block_size` queries"""
+    for start in range(0, queries.shape[0], block_size):
+        yield start, distance_matrix(queries[start : start + block_size], samples)
+
+
+def as_packed(samples):
+    # type: (Union[Sequence[bytes], np.ndarray]) -> np.ndarray
+    """Packed `uint64` matrix from hash digests (already packed input is passed through)"""
+    if isinstance(samples, np.ndarray):
+        return samples
+    return pack_codes(samples)
+
+
+class HammingMatcher:
+    """
+    Brute-force matcher over a packed matrix of sample hash digests.
+
+    Returns the same matches (including order and duplicates) as a pairwise scan over
+    `samples` with `iscc_core.iscc_distance_bytes`.
+    """
+
+    def __init__(self, samples):
+        # type: (Union[Sequence[bytes], np.ndarray]) -> None
+        start = perf_counter()
+        self.packed = as_packed(samples)
+        self.build_time = perf_counter() - start
+
+    @property
+    def nbytes(self):
+        # type: () -> int
+        """Memory footprint of packed digests in bytes"""
+        return self.packed.nbytes
+
+    def search(self, queries, th=10, block_size=BLOCK_SIZE):
+        # type: (np.ndarray, int, int) -> List[np.ndarray]
+        """Sample indices within distance `th` for each row of packed `queries`"""
+        if len(queries) == 0:
+            return []
+        if len(self.packed) == 0:
+            return [np.zeros(0, dtype=np.int64) for _ in range(len(queries))]
+        if queries.shape[1] != self.packed.shape[1]:
+            qlen, slen = queries.shape[1] * 64, self.packed.shape[1] * 64
+            raise AssertionError(f"Hash digest of unequal length: {qlen} vs {slen}")
+        results = []
+        if len(self.packed) <= TILE_SIZE:
+            for _, dist in iter_distance_blocks(queries, self.packed, block_size):
+                results.extend(np.flatnonzero(row <= th) for row in dist)
+            return results
+        for start in range(0, len(queries), block_size):
+            qblock = queries[start : start + block_size]
+            found = [[] for _ in range(len(qblock))]
+            for offset in range(0, len(self.packed), TILE_SIZE):
+                dist = distance_matrix(qblock, self.packed[offset : offset + TILE_SIZE])
+                for idx, row in enumerate(dist):
+                    found[idx].append(np.flatnonzero(row <= th) + offset)
+            results.extend(np.concatenate(f) for f in found)
+        return results
+
+    def query(self, iscc, th=10):
+        # type: (bytes, int) -> List[bytes]
+        """Match a single hash digest with threshold `th`"""
+        return self.query_batch([iscc], th)[0]
+
+    def query_batch(self, isccs, th=10, block_size=BLOCK_SIZE):
+        # type: (Sequence[bytes], int, int) -> List[List[bytes]]
+        """Match a batch of hash digests with threshold `th`"""
+        if len(isccs) == 0:
+            return []
+        results = self.search(pack_codes(isccs), th, block_size)
+        return [[self.packed[idx].tobytes() for idx in found] for found in results]
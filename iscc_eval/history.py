@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+Local results history of benchmark and evaluation runs.
+
+Each run is stored in a SQLite database in the data directory together with system info, library
+versions, a dataset fingerprint, the run parameters, its summary metrics and per-item samples
+(per-file latencies or per-query scores). `compare` uses the samples to test whether differences
+between two runs are larger than their sampling noise.
+"""
+import io
+import json
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import blake3
+import numpy as np
+import typer
+from rich.console import Console
+from rich.table import Table
+import iscc_eval as ie
+from iscc_eval.metrics import resample_sums
+
+
+__all__ = [
+    "history_db",
+    "files_fingerprint",
+    "record",
+    "get_run",
+    "compare_runs",
+]
+
+out = Console()
+app = typer.Typer(no_args_is_help=True, help="ISCC benchmark results history")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created TEXT NOT NULL,
+    command TEXT NOT NULL,
+    dataset TEXT,
+    params TEXT NOT NULL,
+    iscc_core TEXT,
+    iscc_sdk TEXT,
+    system TEXT NOT NULL,
+    metrics TEXT NOT NULL,
+    samples BLOB
+)
+"""
+
+#: Summary metrics compared by `compare` -> True if larger is better
+METRICS = {
+    "bytes_per_second": True,
+    "files_per_second": True,
+    "recall": True,
+    "precision": True,
+    "f1": True,
+}
+
+
+def history_db(path=None):
+    # type: (Optional[Path]) -> sqlite3.Connection
+    """Open (and create) the results history database (default: `history.sqlite` in data_dir)"""
+    path = path or Path(ie.cnf.data_dir) / "history.sqlite"
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    db.execute(SCHEMA)
+    return db
+
+
+def files_fingerprint(files):
+    # type: (List[Path]) -> str
+    """Fingerprint of a list of files by file name and size"""
+    hasher = blake3.blake3()
+    for file in sorted(files, key=lambda f: f.name):
+        hasher.update(f"{file.name}\0{file.stat().st_size}\n".encode("utf-8"))
+    return hasher.hexdigest()[:16]
+
+
+def _pack(samples):
+    # type: (Optional[Dict[str, np.ndarray]]) -> Optional[bytes]
+    if not samples:
+        return None
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **samples)
+    return buffer.getvalue()
+
+
+def _unpack(blob):
+    # type: (Optional[bytes]) -> Dict[str, np.ndarray]
+    if not blob:
+        return {}
+    with np.load(io.BytesIO(blob)) as data:
+        return {key: data[key] for key in data.files}
+
+
+def record(
+    command,  # type: str
+    params,  # type: dict
+    metrics,  # type: dict
+    dataset=None,  # type: Optional[str]
+    samples=None,  # type: Optional[dict]
+    db=None,  # type: Optional[sqlite3.Connection]
+    iscc_core=None,  # type: Optional[str]
+):
+    # type: (...) -> int
+    """
+    Store a run in the results history.
+
+    :param command: Benchmark or evaluation name (e.g. `speed content-code`)
+    :param params: Parameters that must be equal for runs to be comparable
+    :param metrics: Summary metrics (see `METRICS`)
+    :param dataset: Dataset fingerprint
+    :param samples: Per-item arrays used for significance tests (`keys`, `latency`, `size` for
+        speed runs and `keys`, `recall`, `precision`, `f1`, `f1_mask` for match runs)
+    :param iscc_core: Version of iscc-core that generated the evaluated codes (default: installed)
+    :return: Run id
+    """
+    meta = ie.system_meta()
+    if iscc_core is not None:
+        meta["iscc_core"] = iscc_core
+    db = db or history_db()
+    with db:
+        cursor = db.execute(
+            "INSERT INTO runs (created, command, dataset, params, iscc_core, iscc_sdk, system, "
+            "metrics, samples) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                command,
+                dataset,
+                json.dumps(params, sort_keys=True, default=str),
+                meta["iscc_core"],
+                meta["iscc_sdk"],
+                json.dumps(meta),
+                json.dumps(metrics),
+                _pack(samples),
+            ),
+        )
+    return cursor.lastrowid
+
+
+def get_run(selector, like=None, db=None):
+    # type: (str, Optional[sqlite3.Row], Optional[sqlite3.Connection]) -> Optional[sqlite3.Row]
+    """
+    Select a run by id or by library version (`core:<version>` or `sdk:<version>`).
+
+    Version selectors return the latest run with that version that is comparable to `like`
+    (same command, dataset and parameters).
+    """
+    db = db or history_db()
+    if selector.isdigit():
+        return db.execute("SELECT * FROM runs WHERE id = ?", (int(selector),)).fetchone()
+    lib, _, version = selector.partition(":")
+    if lib not in ("core", "sdk") or not version:
+        raise ValueError(f"Invalid run selector {selector} (use <id>, core:<ver> or sdk:<ver>)")
+    sql, args = f"SELECT * FROM runs WHERE iscc_{lib} = ?", [version]
+    if like is not None:
+        sql += " AND command = ? AND dataset IS ? AND params = ? AND id != ?"
+        args += [like["command"], like["dataset"], like["params"], like["id"]]
+    return db.execute(sql + " ORDER BY id DESC", args).fetchone()
+
+
+def _previous(run, db):
+    # type: (sqlite3.Row, sqlite3.Connection) -> Optional[sqlite3.Row]
+    """Latest earlier run comparable to `run`"""
+    return db.execute(
+        "SELECT * FROM runs WHERE command = ? AND dataset IS ? AND params = ? AND id < ? "
+        "ORDER BY id DESC",
+        (run["command"], run["dataset"], run["params"], run["id"]),
+    ).fetchone()
+
+
+def _interval(stats, confidence):
+    # type: (np.ndarray, float) -> Tuple[float, float]
+    alpha = (1 - confidence) / 2
+    lower, upper = np.quantile(stats, [alpha, 1 - alpha])
+    return float(lower), float(upper)
+
+
+def _bootstrap_sums(base, cand, paired, resamples, seed):
+    # type: (np.ndarray, np.ndarray, bool, int, int) -> Tuple[np.ndarray, ...]
+    """
+    Column sums of both runs for the full samples (first row) and `resamples` resamples.
+
+    Paired samples (same items in the same order) are resampled jointly.
+    """
+    if paired:
+        values = np.concatenate([base, cand], axis=1)
+        sums = np.concatenate([values.sum(axis=0)[None], resample_sums(values, resamples, seed)])
+        return sums[:, : base.shape[1]], sums[:, base.shape[1] :]
+    sums_a = np.concatenate([base.sum(axis=0)[None], resample_sums(base, resamples, seed)])
+    sums_b = np.concatenate([cand.sum(axis=0)[None], resample_sums(cand, resamples, seed + 1)])
+    return sums_a, sums_b
+
+
+def _speed_stats(base, cand, resamples, seed):
+    # type: (dict, dict, int, int) -> Dict[str, np.ndarray]
+    """Relative throughput change (paired over files present in both runs if any)"""
+
+    def columns(s, idx=slice(None)):
+        latency = s["latency"][idx]
+        return np.stack([s["size"][idx], latency, np.ones_like(latency)], axis=1)
+
+    common, ia, ib = np.intersect1d(base["keys"], cand["keys"], return_indices=True)
+    if len(common):
+        values_a, values_b = columns(base, ia), columns(cand, ib)
+    else:
+        values_a, values_b = columns(base), columns(cand)
+    sums_a, sums_b = _bootstrap_sums(values_a, values_b, len(common) > 0, resamples, seed)
+    # Throughput as total bytes (files) over total time of the (resampled) files
+    return dict(
+        bytes_per_second=(sums_b[:, 0] / sums_b[:, 1]) / (sums_a[:, 0] / sums_a[:, 1]) - 1,
+        files_per_second=(sums_b[:, 2] / sums_b[:, 1]) / (sums_a[:, 2] / sums_a[:, 1]) - 1,
+    )
+
+
+def _match_stats(base, cand, resamples, seed, paired=False):
+    # type: (dict, dict, int, int, bool) -> Dict[str, np.ndarray]
+    """Absolute change of mean per-query scores (`paired` if both runs have the same queries)"""
+
+    def columns(s):
+        f1 = np.where(s["f1_mask"], s["f1"], 0.0)
+        return np.stack([s["recall"], s["precision"], f1, s["f1_mask"], np.ones_like(f1)], axis=1)
+
+    sums_a, sums_b = _bootstrap_sums(columns(base), columns(cand), paired, resamples, seed)
+
+    def means(sums):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            f1 = np.where(sums[:, 3] > 0, sums[:, 2] / sums[:, 3], 0.0)
+        return dict(recall=sums[:, 0] / sums[:, 4], precision=sums[:, 1] / sums[:, 4], f1=f1)
+
+    means_a, means_b = means(sums_a), means(sums_b)
+    return {name: means_b[name] - means_a[name] for name in means_a}
+
+
+def compare_runs(base, cand, resamples=1000, confidence=0.95, tolerance=0.01, seed=0):
+    # type: (sqlite3.Row, sqlite3.Row, int, float, float, int) -> List[dict]
+    """
+    Compare summary metrics of two runs.
+
+    Changes are computed and bootstrapped from per-item samples of both runs (throughput as
+    relative change, accuracy metrics as absolute change). A change is flagged as regression if
+    its confidence interval lies entirely on the worse side of zero and exceeds `tolerance`.
+    Metrics without samples are compared by their summary values only ("untested").
+
+    :return: One dict per metric with base, candidate, change, interval and status
+    """
+    metrics_a, metrics_b = json.loads(base["metrics"]), json.loads(cand["metrics"])
+    samples_a, samples_b = _unpack(base["samples"]), _unpack(cand["samples"])
+    stats = {}
+    if "latency" in samples_a and "latency" in samples_b:
+        stats = _speed_stats(samples_a, samples_b, resamples, seed)
+    elif "recall" in samples_a and "recall" in samples_b:
+        # Pair per-query scores only for the same queries of the same dataset
+        paired = (
+            base["dataset"] is not None
+            and base["dataset"] == cand["dataset"]
+            and "keys" in samples_a
+            and "keys" in samples_b
+            and np.array_equal(samples_a["keys"], samples_b["keys"])
+        )
+        stats = _match_stats(samples_a, samples_b, resamples, seed, paired)
+    rows = []
+    for name, higher in METRICS.items():
+        if name not in metrics_a or name not in metrics_b:
+            continue
+        a, b = metrics_a[name], metrics_b[name]
+        relative = name.endswith("_per_second")
+        change = (b / a - 1 if a else 0.0) if relative else b - a
+        row = dict(metric=name, base=a, candidate=b, relative=relative)
+        if name in stats:
+            change = float(stats[name][0])
+            lower, upper = _interval(stats[name][1:], confidence)
+            worse = upper < 0 if higher else lower > 0
+            better = lower > 0 if higher else upper < 0
+            if worse and abs(change) > tolerance:
+                status = "regression"
+            elif better and abs(change) > tolerance:
+                status = "improvement"
+            else:
+                status = "ok"
+            row.update(change=change, lower=lower, upper=upper, status=status)
+        else:
+            row.update(change=change, lower=None, upper=None, status="untested")
+        rows.append(row)
+    return rows
+
+
+def _describe(run):
+    # type: (sqlite3.Row) -> str
+    return (
+        f"#{run['id']} {run['created']} - {run['command']} - "
+        f"iscc-core {run['iscc_core']} - iscc-sdk {run['iscc_sdk']}"
+    )
+
+
+def _fmt(value, relative):
+    # type: (Optional[float], bool) -> str
+    if value is None:
+        return "-"
+    return f"{value:+.1%}" if relative else f"{value:+.3f}"
+
+
+@app.command(name="list")
+def list_(
+    command: Optional[str] = typer.Option(None, help="Only show runs of this command."),
+    limit: int = typer.Option(20, help="Maximum number of runs to show."),
+):
+    """List recorded runs (latest first)"""
+    db = history_db()
+    sql, args = "SELECT * FROM runs", []
+    if command:
+        sql, args = sql + " WHERE command = ?", [command]
+    table = Table("Id", "Created", "Command", "Dataset", "iscc-core", "iscc-sdk", "Metrics")
+    for run in db.execute(sql + " ORDER BY id DESC LIMIT ?", args + [limit]):
+        metrics = json.loads(run["metrics"])
+        summary = ", ".join(
+            f"{k} {v:.3g}" for k, v in metrics.items() if k in METRICS and v is not None
+        )
+        table.add_row(
+            str(run["id"]),
+            run["created"],
+            run["command"],
+            run["dataset"] or "-",
+            run["iscc_core"],
+            run["iscc_sdk"],
+            summary,
+        )
+    out.print(table)
+
+
+@app.command()
+def compare(
+    baseline: Optional[str] = typer.Argument(
+        None, help="Baseline run id or library version (core:<ver>, sdk:<ver>)."
+    ),
+    candidate: Optional[str] = typer.Argument(None, help="Candidate run id (default: latest)."),
+    resamples: int = typer.Option(1000, help="Number of bootstrap resamples."),
+    confidence: float = typer.Option(0.95, help="Confidence level of change intervals."),
+    tolerance: float = typer.Option(
+        0.01, help="Smallest change flagged (relative for throughput, absolute for accuracy)."
+    ),
+):
+    """Compare two runs and exit with status 1 on significant regressions"""
+    db = history_db()
+    if candidate:
+        cand = get_run(candidate, db=db)
+    else:
+        cand = db.execute("SELECT * FROM runs ORDER BY id DESC").fetchone()
+    if cand is None:
+        out.print("[red]No candidate run found")
+        raise typer.Exit(2)
+    base = get_run(baseline, cand, db) if baseline else _previous(cand, db)
+    if base is None:
+        out.print(f"[red]No comparable baseline run found for run #{cand['id']}")
+        raise typer.Exit(2)
+    out.print(f"Baseline:  {_describe(base)}")
+    out.print(f"Candidate: {_describe(cand)}")
+    for key in ("command", "dataset", "params"):
+        if base[key] != cand[key]:
+            out.print(f"[yellow]Warning: runs differ in {key}")
+    rows = compare_runs(base, cand, resamples, confidence, tolerance)
+    table = Table("Metric", "Baseline", "Candidate", "Change", f"{confidence:.0%} interval", "")
+    styles = dict(regression="bold red", improvement="green", ok="", untested="dim")
+    for row in rows:
+        interval = "-"
+        if row["lower"] is not None:
+            lower, upper = _fmt(row["lower"], row["relative"]), _fmt(row["upper"], row["relative"])
+            interval = f"[{lower}, {upper}]"
+        table.add_row(
+            row["metric"],
+            f"{row['base']:.4g}",
+            f"{row['candidate']:.4g}",
+            _fmt(row["change"], row["relative"]),
+            interval,
+            f"[{styles[row['status']]}]{row['status']}" if styles[row["status"]] else "ok",
+        )
+    out.print(table)
+    if any(row["status"] == "regression" for row in rows):
+        out.print("[bold red]Significant regression detected")
+        raise typer.Exit(1)
@@ -1,127 +1,350 @@
-from statistics import mean
-from typing import List, Tuple
+import csv
+import json
+from itertools import islice
+from contextlib import nullcontext
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
 import typer
 import iscc_core as ic
 import iscc_sdk as idk
-from diskcache import Index
 import iscc_eval as ie
 from pathlib import Path
 from rich import print
 from rich.progress import track
+from rich.table import Table
 from iscc_eval import state
-
+from time import perf_counter
+from humanize import naturalsize as nsize
+from iscc_eval.hamming import HammingMatcher, BLOCK_SIZE, iter_distance_blocks
+from iscc_eval.mih import MultiIndexHash, CHUNK_DTYPES
+from iscc_eval.metrics import MetricAccumulator
+from iscc_eval.distractors import DISTRACTOR_TYPES
 
 app = typer.Typer(no_args_is_help=True, help="ISCC matching accuracy benchmarks")
 
 
-def query(db: Index, iscc: bytes, th: int = 10) -> List[str]:
-    """Match `iscc` against `db` items with threshold `th`"""
+def query(db: ie.GroundTruthStore, iscc: bytes, th: int = 10) -> List[bytes]:
+    """Match `iscc` against `db` samples with threshold `th`"""
     matches = []
-    for cluster in db.values():
-        for item in cluster:
-            dist = ic.iscc_distance_bytes(iscc, item)
-            if dist <= th:
-                matches.append(item)
+    for row in range(len(db.samples)):
+        item = db.code(row)
+        dist = ic.iscc_distance_bytes(iscc, item)
+        if dist <= th:
+            matches.append(item)
     return matches
 
 
-def evaluate(gdb: Index, mdb: dict) -> Tuple[float, float, float]:
-    """Calculate recall, precision and F1 score for matches (mdb) against ground truth (gdb)"""
-    precisions = []
-    recall = []
-    f1_score = []
-    for k, relevant in track(gdb.items(), description="Evaluating..."):
-        if k == "samples":
-            continue
-        rel = set(relevant)
-        ret = set(mdb[k])
-        if len(rel) == 0 and len(ret) == 0:
-            precisions.append(1.0)
-            recall.append(1.0)
-            continue
-        try:
-            prec = len(rel.intersection(ret)) / len(ret)
-        except ZeroDivisionError:
-            prec = 0
-        precisions.append(prec)
-        rec = len(rel.intersection(ret)) / len(rel)
-        recall.append(rec)
-        try:
-            f1 = 2 * ((prec * rec) / (prec + rec))
-        except ZeroDivisionError:
-            f1 = 0
-        f1_score.append(f1)
+INDEXES = ("brute", "mih")
+
+
+def matcher(db: ie.GroundTruthStore, index: str = "brute", chunk_bits: int = 16):
+    """Build matcher over memory mapped `db` samples (same sample order as `query`)"""
+    if index == "mih":
+        return MultiIndexHash(db.samples, chunk_bits)
+    return HammingMatcher(db.samples)
+
+
+def search(
+    engine, queries: np.ndarray, th: int, batch_size: int = BLOCK_SIZE, latencies=None
+) -> Iterator[np.ndarray]:
+    """Stream sample indices matching packed `queries` (appends per-query seconds to `latencies`)"""
+    for offset in track(range(0, len(queries), batch_size), description="Matching..."):
+        batch = queries[offset : offset + batch_size]
+        start = perf_counter()
+        matches = engine.search(batch, th)
+        if latencies is not None:
+            latencies.extend([(perf_counter() - start) / len(batch)] * len(batch))
+        yield from matches
+
+
+def code_ids(gdb: ie.GroundTruthStore) -> Tuple[np.ndarray, np.ndarray]:
+    """Unique sample codes and the unique code id of every sample (duplicates count once)"""
+    nbytes = gdb.bits // 8
+    if len(gdb.samples) == 0:
+        return np.zeros((0, nbytes), dtype=np.uint8), np.zeros(0, dtype=np.int64)
+    # Rows as opaque byte strings - same order as `np.unique(axis=0)` but much faster
+    rows = np.ascontiguousarray(gdb.codes[: len(gdb.samples)]).view(np.dtype((np.void, nbytes)))
+    uniq, ids = np.unique(rows.reshape(-1), return_inverse=True)
+    return uniq.view(np.uint8).reshape(-1, nbytes), ids.reshape(-1)
+
+
+def relevant(gdb: ie.GroundTruthStore, ids: np.ndarray) -> List[np.ndarray]:
+    """Unique code ids of the cluster variations for every query"""
+    clusters = np.asarray(gdb.cluster[: len(gdb.samples)])
+    order = np.argsort(clusters, kind="stable")
+    keys, starts = np.unique(clusters[order], return_index=True)
+    groups = dict(zip(keys.tolist(), np.split(ids[order], starts[1:])))
+    empty = np.zeros(0, dtype=np.int64)
+    return [np.unique(groups.get(c, empty)) for c in gdb.cluster[len(gdb.samples) :].tolist()]
+
+
+#: Number of queries evaluated per vectorized batch
+EVAL_BATCH = 4096
+
+
+def relevant_keys(gdb: ie.GroundTruthStore, ids: np.ndarray) -> Tuple[np.ndarray, int]:
+    """Sorted unique `cluster * ncodes + code id` keys of all relevant (cluster, code) pairs"""
+    ncodes = int(ids.max()) + 1 if len(ids) else 1
+    clusters = np.asarray(gdb.cluster[: len(gdb.samples)], dtype=np.int64)
+    in_cluster = clusters >= 0
+    return np.unique(clusters[in_cluster] * ncodes + ids[in_cluster]), ncodes
+
+
+def match_counts(
+    found: List[np.ndarray], qclusters: np.ndarray, ids: np.ndarray, keys: np.ndarray, ncodes: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-query true positive and retrieved counts of unique codes for a batch of queries"""
+    nq = len(found)
+    qidx = np.repeat(np.arange(nq, dtype=np.int64), [len(f) for f in found])
+    codes = ids[np.concatenate(found)] if len(qidx) else np.zeros(0, dtype=np.int64)
+    pairs = np.unique(qidx * ncodes + codes)  # Unique (query, code id) pairs
+    pq, pid = np.divmod(pairs, ncodes)
+    ret = np.bincount(pq, minlength=nq)
+    hit = np.isin(qclusters[pq] * ncodes + pid, keys)
+    tp = np.bincount(pq[hit], minlength=nq)
+    return tp, ret
+
+
+def evaluate(
+    gdb: ie.GroundTruthStore,
+    matches: Iterable[np.ndarray],
+    spill: Optional[ie.MatchSpill] = None,
+    acc: Optional[MetricAccumulator] = None,
+) -> Tuple[float, float, float]:
+    """
+    Calculate recall, precision and F1 score for matches against ground truth (gdb).
+
+    Per-query matches are consumed as they stream in and evaluated in vectorized batches on
+    integer code ids. Only aggregated metrics (and per-query scores if `acc` keeps them) are
+    kept. Raw matches are optionally written to `spill`.
+    """
+    _, ids = code_ids(gdb)
+    keys, ncodes = relevant_keys(gdb, ids)
+    nsamples = len(gdb.samples)
+    qclusters = np.asarray(gdb.cluster[nsamples:], dtype=np.int64)
+    rel = np.bincount(keys // ncodes, minlength=len(gdb.clusters))[qclusters]
+    acc = acc if acc is not None else MetricAccumulator()
+    matches = iter(matches)
+    offset = 0
+    while True:
+        found = list(islice(matches, EVAL_BATCH))
+        if not found:
+            break
+        batch = slice(offset, offset + len(found))
+        if spill:
+            for row, f in zip(range(nsamples + offset, nsamples + batch.stop), found):
+                spill.write(row, f)
+        tp, ret = match_counts(found, qclusters[batch], ids, keys, ncodes)
+        rec, prec, f1, f1_mask = acc.add(tp, rel[batch], ret)
         if state["verbose"]:
-            print(f"Query {k.hex()} -> Recall {rec:.2f} - Precision {prec:.2f} - F1 {f1:.2f}")
-    return mean(recall), mean(precisions), mean(f1_score)
+            for i in np.flatnonzero(f1_mask):
+                key = gdb.code(nsamples + offset + i).hex()
+                scores_ = f"Recall {rec[i]:.2f} - Precision {prec[i]:.2f} - F1 {f1[i]:.2f}"
+                print(f"Query {key} -> {scores_}")
+        offset = batch.stop
+    recall, precision, f1 = acc.result()
+    return float(recall), float(precision), float(f1)
+
+
+def sweep(gdb: ie.GroundTruthStore, bits: int) -> List[dict]:
+    """Calculate recall, precision and F1 for every threshold from 0 to `bits` in one pass"""
+    # Set semantics of `evaluate` - duplicate codes count once
+    samples, ids = code_ids(gdb)
+    relevants = relevant(gdb, ids)
+    queries = gdb.queries
+    nth = bits + 1
+    acc = MetricAccumulator((nth,))
+    packed = np.ascontiguousarray(samples).view(np.uint64)
+    blocks = iter_distance_blocks(queries, packed) if len(packed) else iter([])
+    nblocks = -(-len(queries) // BLOCK_SIZE)
+    for offset, dist in track(blocks, total=nblocks, description="Sweeping..."):
+        ret = np.zeros((len(dist), nth), dtype=np.int64)
+        tp = np.zeros((len(dist), nth), dtype=np.int64)
+        rel = np.zeros((len(dist), 1), dtype=np.int64)
+        for row, qdist in enumerate(dist):
+            ret[row] = np.bincount(qdist, minlength=nth)[:nth]
+            rel_idx = relevants[offset + row]
+            tp[row] = np.bincount(qdist[rel_idx], minlength=nth)[:nth]
+            rel[row] = len(rel_idx)
+        acc.add(tp.cumsum(axis=1), rel, ret.cumsum(axis=1))
+    recall, precision, f1 = acc.result()
+    return [dict(th=th, recall=recall[th], precision=precision[th], f1=f1[th]) for th in range(nth)]
+
 
+def sweep_save(results: List[dict], path: Path):
+    """Save sweep results as JSON (.json suffix) or CSV"""
+    with open(path, "wt", encoding="utf8", newline="") as outf:
+        if path.suffix.lower() == ".json":
+            json.dump(results, outf, indent=2)
+        else:
+            writer = csv.DictWriter(outf, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
 
-def db_info(db):
-    queries = len(db) - 1
-    samples = 0
-    for value in db.values():
-        samples += len(value)
-    print(f"Dataset has {queries} queries against {samples} samples\n")
 
+def db_info(db: ie.GroundTruthStore):
+    print(f"{db.info()}\n")
 
-def ground_truth(path: Path, bits: int):
+
+def code_opts(bits: int):
+    """Configure ground truth code generation for Content-Codes with `bits` length"""
+    assert bits in (64, 128, 256)
+    idk.sdk_opts.extract_metadata = False
+    ic.core_opts.audio_bits = bits
+    ic.core_opts.image_bits = bits
+    ic.core_opts.text_bits = bits
+    ic.core_opts.video_bits = bits
+
+
+def detect_mode(manifest: ie.Manifest) -> Optional[str]:
+    """Detect perceptual mode of a dataset (title case) from its first supported file"""
+    mode, entry = manifest.detect_mode()
+    if mode is None:
+        return None
+    mode = mode.title()
+    if state["verbose"]:
+        print(f"\nAssuming perceptual mode {mode} based on {entry.rel}")
+    return mode
+
+
+def ground_truth(
+    path: Path,
+    bits: int,
+    workers: int = 1,
+    cache: bool = True,
+    verify: bool = False,
+    profiler: Optional[ie.StageProfiler] = None,
+    mode: str = "unknown",
+    manifest: Optional[ie.Manifest] = None,
+) -> ie.GroundTruthStore:
     """Generate or load cached ground truth data for cluster path"""
-    db_path: Path = ie.cnf.data_dir / f"{ie.dirhash(path)[:16]}_{bits}"
-    if db_path.exists():
+    manifest = manifest or ie.scan(path)
+    fingerprint = ie.dirhash(path, verify, manifest=manifest.stat_manifest())
+    name = f"{fingerprint[:16]}_{bits}"
+    db_path: Path = ie.cnf.data_dir / f"{name}.gt"
+    legacy_path = legacy_db_path(path, bits) if not db_path.exists() else None
+    if db_path.exists() and store_current(db_path):
         # Load existing ground truth data
         print(f"\nUsing cached ground truth for {path} from {db_path}")
-        gdb = Index(db_path.as_posix())
+        gdb = ie.GroundTruthStore(db_path)
+        if gdb.header["iscc_core"] == "unknown":
+            print("Ground truth codes were created by an unknown iscc-core version")
+        db_info(gdb)
+        if profiler:
+            print("Nothing to profile - ground truth codes are already available\n")
+        return gdb
+    elif legacy_path is not None:
+        # Convert ground truth data from previous versions
+        print(f"\nConverting cached ground truth for {path} from {legacy_path} to {db_path}")
+        gdb = ie.store_convert(legacy_path, db_path, mode)
         db_info(gdb)
         return gdb
     else:
         # Build ground truth data
         print(f"\nProcessing ground truth for {path} to db {db_path}")
-        db_path.mkdir(parents=True, exist_ok=False)
-        gdb = Index(db_path.as_posix())
-        gdb["samples"] = []
-        for item in track(sorted(path.iterdir()), description="Processing..."):
-            if item.is_dir():
-                cluster_key = item.name
-                total, files = ie.get_files(item)
-                qkey = None
-                result = []
-                for idx, fp in enumerate(sorted(files)):
-                    try:
-                        iscc_meta = idk.code_content(fp.as_posix())
-                    except Exception as e:
-                        if state["verbose"]:
-                            print(f"Failed code generation for {item} with {e}")
-                        continue
-                    result.append(iscc_meta.iscc)
-                    iscc_bytes = iscc_meta.iscc_obj.hash_bytes
-                    if idx == 0:
-                        # First file in cluster is the query instance
-                        qkey = iscc_bytes
-                        gdb[qkey] = []
-                        continue
-                    gdb[qkey] = gdb[qkey] + [iscc_bytes]
-                if state["verbose"]:
-                    print(f"Cluster {cluster_key} ground truth: {result[0]} -> {result[1:]}")
-                cluster_distances = []
-                for target in gdb[qkey]:
-                    cluster_distances.append(ic.iscc_distance_bytes(qkey, target))
-                if state["verbose"]:
-                    print(f"Cluster {cluster_key} distances: {cluster_distances}")
-            elif item.is_file():
-                try:
-                    iscc_meta = idk.code_content(item.as_posix())
-                    if state["verbose"]:
-                        print(f"Sample {iscc_meta.iscc} <- {item.name}")
-                except Exception as e:
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        writer = ie.StoreWriter(db_path, mode, dataset=path.as_posix(), fingerprint=fingerprint)
+        gdb = code_store(writer, manifest.clusters(), manifest.samples(), workers, cache, profiler)
+        db_info(gdb)
+        return gdb
+
+
+def store_current(db_path: Path) -> bool:
+    """Check that codes in a cached store were generated with the installed iscc-core version"""
+    version = ie.GroundTruthStore(db_path).header.get("iscc_core")
+    # Stores converted from legacy DBs have no known version - keep them (delete to rebuild)
+    if version in (ic.__version__, "unknown"):
+        return True
+    print(
+        f"\nRebuilding ground truth created with iscc-core {version} (installed {ic.__version__})"
+    )
+    return False
+
+
+def legacy_db_path(path: Path, bits: int) -> Optional[Path]:
+    """Ground truth DB of previous versions for `path` (named by a hash of all file contents)"""
+    # Only pay for hashing all file contents if there are legacy DBs at all
+    if not any(p.is_dir() for p in ie.cnf.data_dir.glob(f"*_{bits}")):
+        return None
+    legacy_path = ie.cnf.data_dir / f"{ie.legacy_dirhash(path)[:16]}_{bits}"
+    return legacy_path if legacy_path.is_dir() else None
+
+
+def code_store(
+    writer: ie.StoreWriter,
+    clusters: Dict[str, List[Path]],
+    samples: List[Path],
+    workers: int = 1,
+    cache: bool = True,
+    profiler: Optional[ie.StageProfiler] = None,
+) -> ie.GroundTruthStore:
+    """
+    Generate codes for cluster files and samples and write them to a ground truth store.
+
+    :param clusters: Cluster name -> sorted file paths (the first file is the query)
+    :param samples: Top-level sample file paths
+    """
+    clusters = {files[0].parent: files for files in clusters.values() if files}
+    items = sorted(list(clusters) + samples)
+    jobs = []  # Files in processing order - cluster files sorted, query first
+    for item in items:
+        jobs.extend(clusters.get(item, [item]))
+    if profiler:
+        # Profile actual code generation - sequential and without code cache
+        results = ie.code_files(jobs, func=profiler.wrap(idk.code_content))
+    else:
+        results = ie.code_files(jobs, workers=workers, cache=cache)
+    with profiler.instrument() if profiler else nullcontext():
+        build_clusters(writer, items, clusters, results)
+    if profiler:
+        print(profiler.table())
+    return writer.close()
+
+
+def build_clusters(
+    writer: ie.StoreWriter, items: List[Path], clusters: dict, results: Iterator[ie.CodeResult]
+):
+    """Assign code generation results (in processing order) to ground truth clusters/samples"""
+    for item in track(items, description="Processing..."):
+        if item in clusters:
+            cluster_key = item.name
+            cid = writer.add_cluster(cluster_key)
+            qkey = None
+            result = []
+            targets = []
+            for fp in clusters[item]:
+                coded = next(results)
+                if coded.error is not None:
                     if state["verbose"]:
-                        print(f"Failed code generation for {item} with {e}")
+                        print(f"Failed code generation for {item} with {coded.error}")
                     continue
+                result.append(coded.iscc)
+                iscc_bytes = ic.Code(coded.iscc).hash_bytes
+                if qkey is None:
+                    # First file in cluster is the query instance
+                    qkey = iscc_bytes
+                    writer.add(qkey, cid, query=True)
+                    continue
+                writer.add(iscc_bytes, cid)
+                targets.append(iscc_bytes)
+            if state["verbose"] and result:
+                print(f"Cluster {cluster_key} ground truth: {result[0]} -> {result[1:]}")
+            cluster_distances = []
+            for target in targets:
+                cluster_distances.append(ic.iscc_distance_bytes(qkey, target))
+            if state["verbose"]:
+                print(f"Cluster {cluster_key} distances: {cluster_distances}")
+        else:
+            coded = next(results)
+            if coded.error is not None:
+                if state["verbose"]:
+                    print(f"Failed code generation for {item} with {coded.error}")
+                continue
+            if state["verbose"]:
+                print(f"Sample {coded.iscc} <- {item.name}")
 
-                iscc_bytes = iscc_meta.iscc_obj.hash_bytes
-                gdb["samples"] = gdb["samples"] + [iscc_bytes]
-
-        db_info(gdb)
-        return gdb
+            iscc_bytes = ic.Code(coded.iscc).hash_bytes
+            writer.add(iscc_bytes)
 
 
 @app.command()
@@ -129,35 +352,343 @@ def content_code(
     path: Path = typer.Argument(..., help="Path to folder with test files"),
     th: int = typer.Option(8, help="Threshold for matching (bit difference)."),
     bits: int = typer.Option(64, help="Content-Code length in number of bits (64, 128, 256)"),
+    sweep_: bool = typer.Option(
+        False, "--sweep", help="Evaluate all thresholds from 0 to bits in one pass."
+    ),
+    out: Optional[Path] = typer.Option(None, help="Save sweep results to CSV or JSON file."),
+    workers: int = typer.Option(1, help="Number of processes for ground truth code generation."),
+    cache: bool = typer.Option(True, help="Reuse cached per-file codes for ground truth."),
+    verify: bool = typer.Option(
+        False, help="Identify dataset by file contents instead of file stat data."
+    ),
+    profile: bool = typer.Option(
+        False, help="Profile processing stages of ground truth code generation (sequential)."
+    ),
+    pstats: Optional[Path] = typer.Option(None, help="Save cProfile stats of profiling to file."),
+    folded: Optional[Path] = typer.Option(None, help="Save collapsed stacks of profiling to file."),
+    index: str = typer.Option("brute", help="Matching index (brute or mih = multi-index hashing)."),
+    chunk_bits: int = typer.Option(16, help="Substring width for mih index (8, 16 or 32)."),
+    check: bool = typer.Option(False, help="Verify index results against brute-force matching."),
+    spill: Optional[Path] = typer.Option(
+        None, help="Save raw per-query matches to file (.jsonl or compact binary)."
+    ),
+    bootstrap: int = typer.Option(
+        1000, help="Number of bootstrap resamples for confidence intervals (0 = off)."
+    ),
+    confidence: float = typer.Option(0.95, help="Confidence level of bootstrap intervals."),
+    record: bool = typer.Option(True, help="Record results in the local results history."),
+    distractors: Optional[str] = typer.Option(
+        None, help="Comma separated counts of synthetic distractors added to samples (e.g. 0,1e6)."
+    ),
+    distractor_type: str = typer.Option(
+        "random", help="Synthetic distractors: random (uniform) or flip (bit-flipped real codes)."
+    ),
+    flip_bits: Optional[str] = typer.Option(
+        None,
+        help="Bit flips of flip distractors: N, LOW-HIGH or normal:MEAN,STD (default 1-bits/2)",
+    ),
+    seed: int = typer.Option(0, help="Random seed for synthetic distractors."),
 ):
-    idk.sdk_opts.extract_metadata = False
-    ic.core_opts.audio_bits = bits
-    assert bits in (64, 128, 256)
-
-    # Detect Perceptual mode
-    mode = None
-    for item in path.rglob("*"):
-        if item.is_file():
-            mtype, mode = idk.mediatype_and_mode(item.as_posix())
-            mode = mode.title()
-            if state["verbose"]:
-                print(f"\nAssuming perceptual mode {mode} based on {item.name}")
-            break
-
+    code_opts(bits)
+    # Reject invalid options before the (potentially long) ground truth build
+    if index not in INDEXES:
+        raise typer.BadParameter(f"Unknown index {index} (use {' or '.join(INDEXES)})")
+    if index == "mih" and chunk_bits not in CHUNK_DTYPES:
+        raise typer.BadParameter(f"Unsupported chunk bits {chunk_bits} (use 8, 16 or 32)")
+    if distractors:
+        if sweep_:
+            raise typer.BadParameter("Threshold sweeps can not be combined with distractors")
+        if distractor_type not in DISTRACTOR_TYPES:
+            raise typer.BadParameter(f"Unknown distractor type {distractor_type}")
+        try:
+            counts = [int(float(n)) for n in distractors.split(",")]
+        except ValueError:
+            raise typer.BadParameter(f"Invalid distractor counts {distractors}")
+        flip_bits = flip_bits or f"1-{bits // 2}"
+        try:
+            ie.flip_distances(flip_bits, 0, bits, np.random.default_rng(seed))
+        except ValueError as e:
+            raise typer.BadParameter(str(e))
+    manifest = ie.scan(path)
+    mode = detect_mode(manifest)
     code_type = f"{mode}-Code"
-    print(f"\n[bold]ISCC Matching Benchmark - {code_type} {bits}-bits - Threshold {th}[/bold]")
+    th_info = "Threshold Sweep" if sweep_ else f"Threshold {th}"
+    print(f"\n[bold]ISCC Matching Benchmark - {code_type} {bits}-bits - {th_info}[/bold]")
     print("==========================================================================\n")
-    gdb = ground_truth(path, bits)
-    mdb = dict()  # Matches DB
+    profiler = None
+    if profile or pstats or folded:
+        profiler = ie.StageProfiler(pstats, folded)
+    gdb = ground_truth(path, bits, workers, cache, verify, profiler, mode or "unknown", manifest)
+    if distractors:
+        print(f"Matching {bits}-bit {code_type}s with threshold {th}-bit distance")
+        rows = distractor_benchmark(
+            gdb, counts, th, index, chunk_bits, distractor_type, flip_bits, seed
+        )
+        if record:
+            params = dict(mode=gdb.mode, bits=bits, th=th, index=index, seed=seed)
+            params.update(distractors=counts, distractor_type=distractor_type)
+            if distractor_type == "flip":
+                params["flip_bits"] = flip_bits
+            largest = rows[-1]
+            metrics = {k: largest[k] for k in ("recall", "precision", "f1", "latency")}
+            record_run(gdb, params, dict(metrics, scaling=rows))
+        return
+    if sweep_:
+        print(f"Matching {bits}-bit {code_type}s with thresholds 0 to {bits}-bit distance")
+        results = sweep(gdb, bits)
+        if state["verbose"]:
+            for r in results:
+                print(
+                    f"Threshold {r['th']} -> Recall {r['recall']:.2f} - "
+                    f"Precision {r['precision']:.2f} - F1 {r['f1']:.2f}"
+                )
+        if out:
+            sweep_save(results, out)
+            print(f"\nSaved sweep results to {out}")
+        best = max(results, key=lambda r: r["f1"])
+        print(
+            f"\n[bold yellow on red]Best result: Recall {best['recall']:.2f} - Precision {best['precision']:.2f} - F1 {best['f1']:.2f} (with {best['th']}-bit threshold)\n"
+        )
+        if record:
+            params = dict(mode=gdb.mode, bits=bits, sweep=True)
+            record_run(gdb, params, dict(best, sweep=results))
+        return
     print(f"Matching {bits}-bit {code_type}s with threshold {th}-bit distance")
-    for item in track(gdb.keys(), description="Matching..."):
-        if item != "samples":
-            mdb[item] = query(gdb, item, th)
+    engine = matcher(gdb, index, chunk_bits)
+    print(f"Index {index}: build time {engine.build_time:.3f} s - memory {nsize(engine.nbytes)}")
+    queries = gdb.queries
+    # Brute-force latencies are amortized over query blocks
+    latencies = []
+    matches = search(engine, queries, th, BLOCK_SIZE if index == "brute" else 1, latencies)
     print(f"\nEvaluating matches with {th}-bit distance")
-    recall, prec, f1 = evaluate(gdb, mdb)
+    acc = MetricAccumulator(keep=bootstrap > 0 or record)
+    with ie.MatchSpill(spill, gdb) if spill else nullcontext() as spill_file:
+        recall, prec, f1 = evaluate(gdb, matches, spill_file, acc)
+    if spill:
+        print(f"Saved raw matches to {spill}")
+    if latencies:
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        mean_ms = np.mean(latencies) * 1000
+        print(f"Query latency: p50 {p50:.3f} ms - p99 {p99:.3f} ms - mean {mean_ms:.3f} ms")
+    if check and index != "brute":
+        brute, mismatches = matcher(gdb), 0
+        for offset in range(0, len(queries), BLOCK_SIZE):
+            batch = queries[offset : offset + BLOCK_SIZE]
+            results = zip(engine.search(batch, th), brute.search(batch, th))
+            mismatches += sum(1 for a, b in results if not np.array_equal(a, b))
+        if mismatches:
+            print(f"[bold red]Index results differ from brute-force for {mismatches} queries")
+        else:
+            print(f"Index results verified against brute-force for {len(queries)} queries")
     print(
         f"\n[bold yellow on red]Matching result: Recall {recall:.2f} - Precision {prec:.2f} - F1 {f1:.2f} (with {th}-bit threshold)\n"
     )
+    if bootstrap > 0 and acc.queries:
+        ci = acc.bootstrap(bootstrap, confidence)
+        bounds = " - ".join(
+            f"{name} [{ci[key][0]:.2f}, {ci[key][1]:.2f}]"
+            for name, key in (("Recall", "recall"), ("Precision", "precision"), ("F1", "f1"))
+        )
+        print(f"{confidence:.0%} confidence ({bootstrap} bootstrap resamples): {bounds}\n")
+    if record:
+        params = dict(mode=gdb.mode, bits=bits, th=th, index=index)
+        if index == "mih":
+            params["chunk_bits"] = chunk_bits
+        metrics = dict(recall=recall, precision=prec, f1=f1, build_time=engine.build_time)
+        if latencies:
+            metrics["latency"] = dict(zip(("p50", "p99"), np.percentile(latencies, [50, 99])))
+        # Queries are identified by their cluster name for paired comparisons
+        keys = np.array([gdb.clusters[c] for c in gdb.cluster[len(gdb.samples) :].tolist()])
+        record_run(gdb, params, metrics, dict(acc.per_query(), keys=keys))
+
+
+def count_hits(matches: Iterable[np.ndarray], first: int, hits: List[int]) -> Iterator[np.ndarray]:
+    """Pass per-query matches through and append the number of sample rows >= `first` to `hits`"""
+    for found in matches:
+        hits.append(int((found >= first).sum()))
+        yield found
+
+
+def distractor_benchmark(
+    gdb: ie.GroundTruthStore,
+    counts: List[int],
+    th: int,
+    index: str = "brute",
+    chunk_bits: int = 16,
+    kind: str = "random",
+    flip_bits: str = "1-32",
+    seed: int = 0,
+) -> List[dict]:
+    """
+    Match queries against samples augmented with growing numbers of synthetic distractors.
+
+    Distractors are generated once for the largest count - smaller counts use a prefix, so every
+    level contains the distractors of all smaller levels.
+    """
+    counts = sorted(set(counts))
+    start = perf_counter()
+    if kind == "flip":
+        codes = ie.flip_codes(np.asarray(gdb.codes), counts[-1], flip_bits, seed)
+    else:
+        codes = ie.random_codes(counts[-1], gdb.bits, seed)
+    info = f" ({flip_bits} bit flips)" if kind == "flip" else ""
+    print(f"Generated {counts[-1]} {kind} distractors{info} in {perf_counter() - start:.3f} s")
+    rows = []
+    for count in counts:
+        aug = ie.store_augment(gdb, codes[:count]) if count else gdb
+        engine = matcher(aug, index, chunk_bits)
+        latencies = []
+        matches = search(engine, aug.queries, th, BLOCK_SIZE if index == "brute" else 1, latencies)
+        hits = []  # Number of distractors matched per query (rows after the original samples)
+        counted = count_hits(matches, len(gdb.samples), hits)
+        recall, precision, f1 = evaluate(aug, counted)
+        p50, p99 = np.percentile(latencies, [50, 99]) if latencies else (0.0, 0.0)
+        rows.append(
+            dict(
+                distractors=count,
+                samples=len(aug.samples),
+                recall=recall,
+                precision=precision,
+                f1=f1,
+                distractor_hits=sum(hits),
+                build_time=engine.build_time,
+                nbytes=engine.nbytes,
+                latency=dict(p50=float(p50), p99=float(p99)),
+            )
+        )
+        if count:
+            # Release memory maps before removing the temporary store
+            path = aug.path
+            del aug, engine, matches, counted
+            path.unlink()
+    print(distractor_table(rows, th))
+    return rows
+
+
+def distractor_table(rows: List[dict], th: int) -> Table:
+    table = Table(title=f"Distractor Scaling ({th}-bit threshold)")
+    columns = ("Distractors", "Samples", "Recall", "Precision", "F1", "Distractor hits")
+    for column in columns + ("Index build", "Index memory", "Latency p50", "Latency p99"):
+        table.add_column(column, justify="right")
+    for row in rows:
+        table.add_row(
+            str(row["distractors"]),
+            str(row["samples"]),
+            f"{row['recall']:.2f}",
+            f"{row['precision']:.2f}",
+            f"{row['f1']:.2f}",
+            str(row["distractor_hits"]),
+            f"{row['build_time']:.3f} s",
+            nsize(row["nbytes"]),
+            f"{row['latency']['p50'] * 1000:.3f} ms",
+            f"{row['latency']['p99'] * 1000:.3f} ms",
+        )
+    return table
+
+
+def record_run(gdb, params, metrics, samples=None):
+    # type: (ie.GroundTruthStore, dict, dict, Optional[dict]) -> None
+    """Record a matching run in the results history (dataset identity from the store header)"""
+    dataset = gdb.header.get("fingerprint") or gdb.header.get("dataset")
+    metrics = json.loads(json.dumps(metrics, default=float))
+    iscc_core = gdb.header.get("iscc_core")
+    run_id = ie.record("match content-code", params, metrics, dataset, samples, iscc_core=iscc_core)
+    print(f"Recorded results as run #{run_id} (compare with `iscc-eval history compare`)")
+
+
+@app.command()
+def shard(
+    path: Path = typer.Argument(..., help="Path to folder with test files"),
+    index: int = typer.Option(..., help="Index of the shard to build (0 to shards - 1)."),
+    shards: int = typer.Option(..., help="Total number of shards."),
+    out: Path = typer.Option(..., help="Shard file to write."),
+    bits: int = typer.Option(64, help="Content-Code length in number of bits (64, 128, 256)"),
+    workers: int = typer.Option(1, help="Number of processes for ground truth code generation."),
+    cache: bool = typer.Option(True, help="Reuse cached per-file codes for ground truth."),
+):
+    """Build ground truth codes for one shard of a dataset (combine shards with merge)"""
+    if not 0 <= index < shards:
+        raise typer.BadParameter(f"Shard index {index} out of range for {shards} shards")
+    code_opts(bits)
+    # Reject invalid options before the (potentially long) ground truth build
+    if index not in INDEXES:
+        raise typer.BadParameter(f"Unknown index {index} (use {' or '.join(INDEXES)})")
+    if index == "mih" and chunk_bits not in CHUNK_DTYPES:
+        raise typer.BadParameter(f"Unsupported chunk bits {chunk_bits} (use 8, 16 or 32)")
+    if distractors:
+        if sweep_:
+            raise typer.BadParameter("Threshold sweeps can not be combined with distractors")
+        if distractor_type not in DISTRACTOR_TYPES:
+            raise typer.BadParameter(f"Unknown distractor type {distractor_type}")
+        try:
+            counts = [int(float(n)) for n in distractors.split(",")]
+        except ValueError:
+            raise typer.BadParameter(f"Invalid distractor counts {distractors}")
+        flip_bits = flip_bits or f"1-{bits // 2}"
+        try:
+            ie.flip_distances(flip_bits, 0, bits, np.random.default_rng(seed))
+        except ValueError as e:
+            raise typer.BadParameter(str(e))
+    manifest = ie.scan(path)
+    mode = detect_mode(manifest) or "unknown"
+    # Content fingerprint - stat data (mtime, inode) differs between copies on different nodes
+    fingerprint = ie.dirhash(path, verify=True, manifest=manifest.stat_manifest())
+    # Clusters and samples are assigned by name so that every node computes the same split
+    clusters = {
+        name: files
+        for name, files in manifest.clusters().items()
+        if ie.shard_of(name, shards) == index
+    }
+    samples = [fp for fp in manifest.samples() if ie.shard_of(fp.name, shards) == index]
+    files = len(samples) + sum(len(files) for files in clusters.values())
+    print(f"Shard {index}/{shards}: {len(clusters)} clusters and {len(samples)} samples -> {out}")
+    writer = ie.StoreWriter(
+        out,
+        mode,
+        bits,
+        dataset=path.as_posix(),
+        fingerprint=fingerprint,
+        shard=index,
+        shards=shards,
+        files=files,
+    )
+    gdb = code_store(writer, clusters, samples, workers, cache)
+    db_info(gdb)
+
+
+@app.command()
+def merge(
+    shards: List[Path] = typer.Argument(..., help="Shard files built with the shard command."),
+    out: Optional[Path] = typer.Option(
+        None, help="Store file (default: data directory store used by `content-code --verify`)."
+    ),
+):
+    """Merge and validate shard files into a single ground truth store"""
+    header = ie.GroundTruthStore(shards[0]).header
+    try:
+        if out is None:
+            if "fingerprint" not in header:
+                raise ValueError(f"{shards[0]} is not a shard store")
+            out = ie.cnf.data_dir / f"{header['fingerprint'][:16]}_{header['bits']}.gt"
+        gdb = ie.store_merge(shards, out)
+    except ValueError as e:
+        print(f"[bold red]Merge failed: {e}")
+        raise typer.Exit(1)
+    print(f"Merged {len(shards)} shards into {out}")
+    db_info(gdb)
+
+
+@app.command()
+def convert(
+    db_path: Path = typer.Argument(..., help="Path to ground truth DB of previous versions."),
+    out: Optional[Path] = typer.Option(None, help="Store file (default: DB path with .gt suffix)."),
+    mode: str = typer.Option("unknown", help="Perceptual mode of the ground truth codes."),
+):
+    """Convert a diskcache ground truth DB to a memory-mappable store file"""
+    out = out or db_path.with_name(db_path.name + ".gt")
+    gdb = ie.store_convert(db_path, out, mode)
+    print(f"Converted {db_path} to {out}")
+    db_info(gdb)
 
 
 if __name__ == "__main__":
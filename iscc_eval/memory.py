@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Peak memory of ISCC code generation per file.
+
+Every file is processed in a fresh worker process (one task per child), so the peak resident set
+size of the worker (`ru_maxrss`) and of the decoder subprocesses it waited for (ffmpeg, fpcalc,
+exiv2, ...) can be attributed to a single file. The Python side is traced with `tracemalloc`
+(peak traced size and the largest allocation sites still held after code generation). The peak
+RSS of an idle worker is measured first and reported as baseline. The memory attributed to a file
+is the worker peak above baseline plus the largest decoder peak.
+"""
+import multiprocessing
+import sys
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from statistics import median
+from typing import Callable, Dict, List, Optional
+from humanize import naturalsize as nsize
+from rich.table import Table
+import iscc_eval as ie
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+
+__all__ = [
+    "memory_supported",
+    "memory_profile",
+    "memory_summary",
+    "memory_table",
+]
+
+#: `ru_maxrss` unit in bytes (kilobytes on Linux, bytes on macOS)
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def memory_supported():
+    # type: () -> bool
+    """Per-process peak RSS is only available on platforms with the `resource` module"""
+    return resource is not None
+
+
+def _measure(func, fp, top):
+    # type: (Optional[Callable], Optional[str], int) -> dict
+    """Worker task - code a single file (or nothing for the baseline) and report peak memory"""
+    tracemalloc.start()
+    error = None
+    try:
+        if fp is not None:
+            func(fp)
+    except Exception as e:
+        error = str(e)
+    python_peak = tracemalloc.get_traced_memory()[1]
+    stats = tracemalloc.take_snapshot().statistics("lineno")[:top]
+    tracemalloc.stop()
+    return dict(
+        rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_UNIT,
+        children_rss=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * MAXRSS_UNIT,
+        python_peak=python_peak,
+        top=[dict(site=str(s.traceback[0]), size=s.size) for s in stats],
+        error=error,
+    )
+
+
+def memory_profile(files, func, workers=1, top=3):
+    # type: (List[Path], Callable, int, int) -> dict
+    """
+    Measure peak memory of code generator `func` for each of `files`.
+
+    :param files: Files to process
+    :param func: Module level code generator (must be picklable)
+    :param workers: Number of files processed concurrently (each in its own process)
+    :param top: Number of largest Python allocation sites to keep per file
+    :return: Baseline worker peak RSS and per-file records
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        # Import (incl. subprocesses run at import time) once in the server, not per file
+        ctx.set_forkserver_preload(["iscc_sdk", "iscc_eval.parallel", "iscc_eval.memory"])
+    else:
+        ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        max_tasks_per_child=1,
+        initializer=ie.opts_restore,
+        initargs=(ie.opts_snapshot(),),
+    ) as executor:
+        baseline = executor.submit(_measure, None, None, 0).result()["rss"]
+        fps = [file.as_posix() for file in files]
+        results = executor.map(_measure, [func] * len(fps), fps, [top] * len(fps))
+        per_file = []
+        for file, result in zip(files, results):
+            size = file.stat().st_size
+            result.update(path=file.as_posix(), size=size, mode=ie.detect_mediatype(file)[1])
+            # Decoders run while the worker holds its memory - budget for both
+            result["peak"] = max(result["rss"] - baseline, 0) + result["children_rss"]
+            result["per_byte"] = result["peak"] / size if size else 0.0
+            per_file.append(result)
+    return dict(baseline=baseline, per_file=per_file)
+
+
+def memory_summary(result, key):
+    # type: (dict, Callable[[dict], str]) -> Dict[str, dict]
+    """Memory figures per group of files (`key` maps a per-file record to its group label)"""
+    groups = {}  # type: Dict[str, List[dict]]
+    for record in result["per_file"]:
+        groups.setdefault(key(record), []).append(record)
+    summary = {}
+    for label, records in sorted(groups.items()):
+        total = sum(r["size"] for r in records)
+        summary[label] = dict(
+            files=len(records),
+            peak_max=max(r["peak"] for r in records),
+            peak_p50=median(r["peak"] for r in records),
+            per_byte_p50=median(r["per_byte"] for r in records),
+            per_byte_mean=sum(r["peak"] for r in records) / total if total else 0.0,
+            python_peak_max=max(r["python_peak"] for r in records),
+            children_max=max(r["children_rss"] for r in records),
+        )
+    return summary
+
+
+def memory_table(summary, title):
+    # type: (Dict[str, dict], str) -> Table
+    """Memory breakdown table for a `memory_summary`"""
+    table = Table(title=f"Peak Memory by {title}")
+    columns = ("Files", "Peak max", "Peak p50", "Bytes/byte p50", "Python max", "Decoder max")
+    for column in (title,) + columns:
+        table.add_column(column, justify="right")
+    for label, group in summary.items():
+        table.add_row(
+            label,
+            str(group["files"]),
+            nsize(group["peak_max"]),
+            nsize(group["peak_p50"]),
+            f"{group['per_byte_p50']:.2f}",
+            nsize(group["python_peak_max"]),
+            nsize(group["children_max"]),
+        )
+    return table
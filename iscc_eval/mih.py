@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Multi-index hashing for sublinear hamming range search on ISCC hash digests"""
+from itertools import combinations
+from math import comb
+from time import perf_counter
+from typing import List, Sequence, Union
+import numpy as np
+from iscc_eval.hamming import as_packed, pack_codes, popcount
+
+
+__all__ = [
+    "MultiIndexHash",
+]
+
+#: Supported substring widths in bits and their (big-endian) dtypes
+CHUNK_DTYPES = {8: ">u1", 16: ">u2", 32: ">u4"}
+
+
+def flip_masks(width, radius):
+    # type: (int, int) -> np.ndarray
+    """All `width`-bit masks with at most `radius` bits set"""
+    masks = [0]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(width), r):
+            masks.append(sum(1 << b for b in bits))
+    return np.array(masks, dtype=np.uint64)
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing (Norouzi et al.) over equal length hash digests.
+
+    Digests are split into `m` disjoint substrings with one sorted lookup table per substring.
+    If two digests are within hamming distance `th`, at least one pair of their substrings is
+    within distance `th // m` (pigeonhole principle). Candidates from probing all substring
+    neighbourhoods are verified against the full digest, so results are exact and returned in
+    the same order as a brute-force scan (`HammingMatcher`).
+    """
+
+    def __init__(self, samples, chunk_bits=16):
+        # type: (Union[Sequence[bytes], np.ndarray], int) -> None
+        start = perf_counter()
+        if chunk_bits not in CHUNK_DTYPES:
+            raise ValueError(f"Unsupported substring width {chunk_bits} (use 8, 16 or 32)")
+        self.chunk_bits = chunk_bits
+        self.packed = as_packed(samples)
+        self.bits = self.packed.shape[1] * 64
+        self.m = self.bits // chunk_bits
+        self.dtype = np.dtype(CHUNK_DTYPES[chunk_bits])
+        key_dtype = self.dtype.newbyteorder("=")
+        index_dtype = np.int32 if len(self.packed) < 2**31 else np.int64
+        chunks = self._chunks(self.packed)
+        self.order = []  # Sample indices per table sorted by substring value
+        self.keys = []  # Sorted substring values per table
+        for j in range(self.m):
+            order = np.argsort(chunks[:, j], kind="stable")
+            self.order.append(order.astype(index_dtype))
+            self.keys.append(chunks[order, j].astype(key_dtype))
+        self._masks = {}
+        self.build_time = perf_counter() - start
+
+    def _chunks(self, packed):
+        # type: (np.ndarray) -> np.ndarray
+        """Substring values of packed codes with shape (len(packed), m) as uint64"""
+        data = np.ascontiguousarray(packed).view(np.uint8)
+        return data.view(self.dtype).reshape(len(packed), self.m).astype(np.uint64)
+
+    @property
+    def nbytes(self):
+        # type: () -> int
+        """Memory footprint of packed digests and lookup tables in bytes"""
+        tables = sum(o.nbytes for o in self.order) + sum(k.nbytes for k in self.keys)
+        return self.packed.nbytes + tables
+
+    def masks(self, radius):
+        # type: (int) -> np.ndarray
+        if radius not in self._masks:
+            self._masks[radius] = flip_masks(self.chunk_bits, radius)
+        return self._masks[radius]
+
+    def candidates(self, chunks, th):
+        # type: (np.ndarray, int) -> np.ndarray
+        """Sorted unique candidate sample indices for a query with substring values `chunks`"""
+        radius = th // self.m
+        nprobes = self.m * sum(comb(self.chunk_bits, r) for r in range(radius + 1))
+        if nprobes >= len(self.packed):
+            # Probing would cost more than a full scan
+            return np.arange(len(self.packed))
+        masks = self.masks(radius)
+        found = []
+        for j in range(self.m):
+            probes = np.bitwise_xor(chunks[j], masks).astype(self.keys[j].dtype)
+            lo = np.searchsorted(self.keys[j], probes, side="left")
+            hi = np.searchsorted(self.keys[j], probes, side="right")
+            hit = hi > lo
+            if not hit.any():
+                continue
+            lo, hi = lo[hit], hi[hit]
+            # Concatenate ranges lo[i]:hi[i] without a python loop
+            sizes = hi - lo
+            offsets = np.repeat(lo - np.cumsum(sizes) + sizes, sizes)
+            found.append(self.order[j][offsets + np.arange(sizes.sum())])
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def search(self, queries, th=10):
+        # type: (np.ndarray, int) -> List[np.ndarray]
+        """Sample indices within distance `th` for each row of packed `queries`"""
+        if len(queries) == 0:
+            return []
+        if len(self.packed) == 0:
+            return [np.zeros(0, dtype=np.int64) for _ in range(len(queries))]
+        results = []
+        for query, qchunks in zip(queries, self._chunks(queries)):
+            cands = self.candidates(qchunks, th)
+            dist = popcount(np.bitwise_xor(self.packed[cands], query)).sum(axis=1)
+            results.append(cands[dist <= th])
+        return results
+
+    def query(self, iscc, th=10):
+        # type: (bytes, int) -> List[bytes]
+        """Match a single hash digest with threshold `th`"""
+        return self.query_batch([iscc], th)[0]
+
+    def query_batch(self, isccs, th=10):
+        # type: (Sequence[bytes], int) -> List[List[bytes]]
+        """Match a batch of hash digests with threshold `th`"""
+        if len(isccs) == 0:
+            return []
+        results = self.search(pack_codes(isccs), th)
+        return [[self.packed[idx].tobytes() for idx in found] for found in results]
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Run ISCC code generation for many files across a process pool"""
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Deque, Iterable, Iterator, NamedTuple, Optional
+import iscc_core as ic
+import iscc_sdk as idk
+import iscc_eval as ie
+
+
+__all__ = [
+    "CodeResult",
+    "opts_snapshot",
+    "opts_restore",
+    "code_file",
+    "code_files",
+]
+
+
+class CodeResult(NamedTuple):
+    """Outcome of code generation for a single file"""
+
+    path: Path
+    iscc: Optional[str] = None
+    error: Optional[str] = None
+    elapsed: Optional[float] = None
+
+
+def opts_snapshot():
+    # type: () -> dict
+    """Capture current iscc-core and iscc-sdk options for use in worker processes"""
+    return dict(core=ic.core_opts.dict(), sdk=idk.sdk_opts.dict())
+
+
+def opts_restore(snapshot):
+    # type: (dict) -> None
+    """Apply options captured with `opts_snapshot` (worker process initializer)"""
+    for key, value in snapshot["core"].items():
+        setattr(ic.core_opts, key, value)
+    for key, value in snapshot["sdk"].items():
+        setattr(idk.sdk_opts, key, value)
+
+
+def code_file(path, func=idk.code_content, cache=False):
+    # type: (Path, Callable, bool) -> CodeResult
+    """Generate code for `path` with `func` and capture failures as error message"""
+    start = perf_counter()
+    try:
+        if cache:
+            iscc = ie.cached_code(path, func)
+        else:
+            iscc = func(path.as_posix()).iscc
+    except Exception as e:
+        return CodeResult(path, error=str(e), elapsed=perf_counter() - start)
+    return CodeResult(path, iscc=iscc, elapsed=perf_counter() - start)
+
+
+def code_files(paths, workers=1, func=idk.code_content, cache=False):
+    # type: (Iterable[Path], int, Callable, bool) -> Iterator[CodeResult]
+    """
+    Generate codes for `paths` with `func`, yielding results in input order.
+
+    :param paths: File paths to process
+    :param int workers: Number of worker processes (1 = sequential in current process)
+    :param func: Module level code generator function (must be picklable)
+    :param bool cache: Consult and update the persistent code cache
+    """
+    if workers <= 1:
+        for path in paths:
+            yield code_file(path, func, cache)
+        return
+    # Bounded number of pending jobs so that large path iterables are consumed lazily
+    pending = deque()  # type: Deque[Future]
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=opts_restore, initargs=(opts_snapshot(),)
+    ) as executor:
+        for path in paths:
+            pending.append(executor.submit(code_file, path, func, cache))
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""Attribute wall and CPU time of ISCC code generation to processing stages"""
+import cProfile
+import functools
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+import iscc_core as ic
+import iscc_sdk as idk
+from rich.table import Table
+
+
+__all__ = [
+    "STAGES",
+    "StageProfiler",
+]
+
+#: Processing stage -> (module, function names) to instrument
+STAGES = {
+    "mediatype": (idk, ("mediatype_and_mode",)),
+    "decode": (idk, ("run_ffmpeg", "run_fpcalc", "run_exiv2", "run_exiv2json", "run_tika")),
+    "metadata": (
+        idk,
+        (
+            "extract_metadata",
+            "image_meta_extract",
+            "audio_meta_extract",
+            "video_meta_extract",
+            "text_meta_extract",
+            "image_thumbnail",
+            "audio_thumbnail",
+            "video_thumbnail",
+            "text_thumbnail",
+            "image_to_data_url",
+        ),
+    ),
+    "features": (
+        idk,
+        (
+            "audio_features_extract",
+            "video_features_extract",
+            "read_mp7_signature",
+            "image_normalize",
+            "text_extract",
+            "text_features",
+        ),
+    ),
+    "hashing": (
+        ic,
+        (
+            "gen_meta_code_v0",
+            "gen_text_code_v0",
+            "gen_image_code_v0",
+            "gen_audio_code_v0",
+            "gen_video_code_v0",
+            "gen_data_code_v0",
+            "gen_instance_code_v0",
+            "gen_iscc_code_v0",
+        ),
+    ),
+}
+
+#: Time not spent in any instrumented stage
+OTHER = "other"
+
+
+def cpu_time():
+    # type: () -> float
+    """CPU time of current process including terminated child processes (decoders)"""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+class StageProfiler:
+    """
+    Per-file stage profiler for code generator functions.
+
+    Instrumented functions are timed exclusively (time spent in nested instrumented calls
+    is attributed to the nested stage only). Remaining time is attributed to `other`.
+    """
+
+    def __init__(self, pstats=None, folded=None):
+        # type: (Optional[Path], Optional[Path]) -> None
+        self.pstats = pstats
+        self.folded = folded
+        self.records = []  # type: List[dict]
+        self.stacks = defaultdict(float)  # type: Dict[str, float]
+        self._frames = []  # type: List[list]
+        self._mode = None  # type: Optional[str]
+        self._root = ""
+        self._profile = cProfile.Profile() if pstats else None
+
+    def _instrument(self, stage, name, func):
+        # type: (str, str, Callable) -> Callable
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            self._frames.append([name, perf_counter(), cpu_time(), 0.0, 0.0])
+            try:
+                result = func(*args, **kwargs)
+                if name == "mediatype_and_mode" and self._mode is None:
+                    self._mode = result[1]
+                return result
+            finally:
+                self._exit(stage)
+
+        return wrapper
+
+    def _exit(self, stage):
+        # type: (str) -> None
+        stack = [frame[0] for frame in self._frames]
+        name, wall_start, cpu_start, child_wall, child_cpu = self._frames.pop()
+        wall = perf_counter() - wall_start
+        cpu = cpu_time() - cpu_start
+        if self._frames:
+            self._frames[-1][3] += wall
+            self._frames[-1][4] += cpu
+        record = self.records[-1]["stages"]
+        record[stage]["wall"] += wall - child_wall
+        record[stage]["cpu"] += cpu - child_cpu
+        self.stacks[";".join([self._root] + stack)] += wall - child_wall
+
+    @contextmanager
+    def instrument(self):
+        """Patch stage functions with timing wrappers for the duration of the context"""
+        originals = []
+        for stage, (module, names) in STAGES.items():
+            for name in names:
+                func = getattr(module, name, None)
+                if func is None:
+                    continue
+                originals.append((module, name, func))
+                setattr(module, name, self._instrument(stage, name, func))
+        if self._profile:
+            self._profile.enable()
+        try:
+            yield self
+        finally:
+            if self._profile:
+                self._profile.disable()
+            for module, name, func in originals:
+                setattr(module, name, func)
+            self.save()
+
+    def wrap(self, func):
+        # type: (Callable) -> Callable
+        """Wrap code generator `func` to record a stage profile per call"""
+
+        @functools.wraps(func)
+        def wrapper(fp, *args, **kwargs):
+            self._root = func.__name__
+            self._mode = None
+            stages = {stage: dict(wall=0.0, cpu=0.0) for stage in list(STAGES) + [OTHER]}
+            record = dict(path=str(fp), mode=None, wall=0.0, cpu=0.0, stages=stages)
+            self.records.append(record)
+            wall_start, cpu_start = perf_counter(), cpu_time()
+            try:
+                return func(fp, *args, **kwargs)
+            finally:
+                record["wall"] = perf_counter() - wall_start
+                record["cpu"] = cpu_time() - cpu_start
+                record["mode"] = self._mode or "-"
+                stages[OTHER]["wall"] = record["wall"] - sum(s["wall"] for s in stages.values())
+                stages[OTHER]["cpu"] = record["cpu"] - sum(s["cpu"] for s in stages.values())
+                self.stacks[self._root] += stages[OTHER]["wall"]
+
+        return wrapper
+
+    def save(self):
+        """Write cProfile stats and collapsed stacks (flamegraph.pl / speedscope format)"""
+        if self._profile and self.pstats:
+            self._profile.dump_stats(self.pstats)
+        if self.folded:
+            with open(self.folded, "wt", encoding="utf8") as outf:
+                for stack, seconds in sorted(self.stacks.items()):
+                    outf.write(f"{stack} {max(int(seconds * 1e6), 0)}\n")
+
+    def summary(self):
+        # type: () -> Dict[str, dict]
+        """Aggregate stage wall and CPU time per mode (and `all`)"""
+        modes = {}
+        for record in self.records:
+            for mode in (record["mode"], "all"):
+                if mode not in modes:
+                    stages = {stage: dict(wall=0.0, cpu=0.0) for stage in list(STAGES) + [OTHER]}
+                    modes[mode] = dict(files=0, wall=0.0, cpu=0.0, stages=stages)
+                agg = modes[mode]
+                agg["files"] += 1
+                agg["wall"] += record["wall"]
+                agg["cpu"] += record["cpu"]
+                for stage, times in record["stages"].items():
+                    agg["stages"][stage]["wall"] += times["wall"]
+                    agg["stages"][stage]["cpu"] += times["cpu"]
+        return modes
+
+    def table(self):
+        # type: () -> Table
+        """Per-stage breakdown table (wall time, share of wall time and CPU time)"""
+        table = Table(title="Stage Profile")
+        table.add_column("Mode")
+        table.add_column("Stage")
+        for column in ("Files", "Wall", "Share", "CPU"):
+            table.add_column(column, justify="right")
+        for mode, agg in self.summary().items():
+            files = str(agg["files"])
+            for stage, times in agg["stages"].items():
+                share = times["wall"] / agg["wall"] if agg["wall"] else 0.0
+                wall, cpu = f"{times['wall']:.3f} s", f"{times['cpu']:.3f} s"
+                table.add_row(mode, stage, files, wall, f"{share:.0%}", cpu)
+            wall, cpu = f"{agg['wall']:.3f} s", f"{agg['cpu']:.3f} s"
+            table.add_row(mode, "[bold]total", files, wall, "", cpu, end_section=True)
+        return table
@@ -1,76 +1,810 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import cycle
 from pathlib import Path
-from typing import Optional, List, Callable
+from statistics import median, pstdev
+from time import perf_counter
+from typing import Dict, Optional, List, Callable
+import numpy as np
 import iscc_sdk as idk
 import typer
 from codetiming import Timer
 from humanize import naturalsize as nsize
 import iscc_eval as ie
 from rich.console import Console
-
+from rich.table import Table
 
 out = Console()
 app = typer.Typer(no_args_is_help=True, help="ISCC execution speed benchmarks")
 
+POOLS = ("thread", "process")
+#: Code generators available for load tests
+GENERATORS = dict(
+    content=idk.code_content,
+    iscc=idk.code_iscc,
+    instance=idk.code_instance,
+    data=idk.code_data,
+    meta=idk.code_meta,
+)
+#: Fraction of peak throughput at which a concurrency level counts as saturated (closed loop)
+SATURATION_PEAK = 0.9
+#: Growth of queueing delay over a level (in median service times) that counts as saturated
+SATURATION_QUEUE = 1.0
+SIZE_BUCKETS = (
+    (100_000, "< 100 kB"),
+    (1_000_000, "< 1 MB"),
+    (10_000_000, "< 10 MB"),
+    (100_000_000, "< 100 MB"),
+)
+
+# Options shared by all speed benchmark commands
+PATH = typer.Argument(None)
+CACHE = typer.Option(False, help="Add generated codes to the code cache after timing.")
+WORKERS = typer.Option(1, help="Number of parallel workers.")
+SWEEP_WORKERS = typer.Option(
+    None, help="Comma separated worker counts for a scaling benchmark (e.g. 1,2,4,8)."
+)
+POOL = typer.Option("both", help="Worker pool type for scaling benchmarks (thread, process, both).")
+WARMUP = typer.Option(1, help="Number of untimed warmup passes over all files.")
+REPEATS = typer.Option(3, help="Number of timed passes over all files.")
+JSON = typer.Option(None, "--json", help="Save machine readable results to JSON file.")
+PROFILE = typer.Option(False, help="Run an extra pass with per-stage time profiling.")
+PSTATS = typer.Option(None, help="Save cProfile stats of the profiling pass to file.")
+FOLDED = typer.Option(None, help="Save collapsed stacks (flamegraph) of profiling pass to file.")
+RECORD = typer.Option(True, help="Record results in the local results history.")
+MEMORY = typer.Option(
+    False, help="Run an extra pass measuring peak memory per file (incl. decoder processes)."
+)
+
 
 @app.command()
-def instance_code(path: Optional[Path] = typer.Argument(None)):
+def instance_code(
+    path: Optional[Path] = PATH,
+    cache: bool = CACHE,
+    workers: int = WORKERS,
+    sweep_workers: Optional[str] = SWEEP_WORKERS,
+    pool: str = POOL,
+    warmup: int = WARMUP,
+    repeats: int = REPEATS,
+    json_: Optional[Path] = JSON,
+    profile: bool = PROFILE,
+    pstats: Optional[Path] = PSTATS,
+    folded: Optional[Path] = FOLDED,
+    record: bool = RECORD,
+    memory: bool = MEMORY,
+):
     """Benchmark Instance-Code processing speed."""
-    total, files = ie.get_files(path, recursive=True)
-    out.print(ie.system_info("Instance-Code"))
-    out.print(f"Benchmarking with {len(files)} files (total size: {nsize(total)}) on single core.")
-    result = speed_benchmark(files, idk.code_instance, total)
-    out.print(result)
+    run_benchmark("Instance-Code", idk.code_instance, **locals())
 
 
 @app.command()
-def data_code(path: Optional[Path] = typer.Argument(None)):
+def data_code(
+    path: Optional[Path] = PATH,
+    cache: bool = CACHE,
+    workers: int = WORKERS,
+    sweep_workers: Optional[str] = SWEEP_WORKERS,
+    pool: str = POOL,
+    warmup: int = WARMUP,
+    repeats: int = REPEATS,
+    json_: Optional[Path] = JSON,
+    profile: bool = PROFILE,
+    pstats: Optional[Path] = PSTATS,
+    folded: Optional[Path] = FOLDED,
+    record: bool = RECORD,
+    memory: bool = MEMORY,
+):
     """Benchmark Data-Code processing speed."""
-    total, files = ie.get_files(path, recursive=True)
-    out.print(ie.system_info("Data-Code"))
-    out.print(f"Benchmarking with {len(files)} files (total size: {nsize(total)}) on single core.")
-    result = speed_benchmark(files, idk.code_data, total)
-    out.print(result)
+    run_benchmark("Data-Code", idk.code_data, **locals())
 
 
 @app.command()
-def content_code(path: Optional[Path] = typer.Argument(None)):
+def content_code(
+    path: Optional[Path] = PATH,
+    cache: bool = CACHE,
+    workers: int = WORKERS,
+    sweep_workers: Optional[str] = SWEEP_WORKERS,
+    pool: str = POOL,
+    warmup: int = WARMUP,
+    repeats: int = REPEATS,
+    json_: Optional[Path] = JSON,
+    profile: bool = PROFILE,
+    pstats: Optional[Path] = PSTATS,
+    folded: Optional[Path] = FOLDED,
+    record: bool = RECORD,
+    memory: bool = MEMORY,
+):
     """Benchmark Content-Code processing speed."""
-    total, files = ie.get_files(path, recursive=True)
-    out.print(ie.system_info("Content-Code"))
-    out.print(f"Benchmarking with {len(files)} files (total size: {nsize(total)}) on single core.")
-    result = speed_benchmark(files, idk.code_content, total)
-    out.print(result)
+    run_benchmark("Content-Code", idk.code_content, **locals())
 
 
 @app.command()
-def meta_code(path: Optional[Path] = typer.Argument(None)):
+def meta_code(
+    path: Optional[Path] = PATH,
+    cache: bool = CACHE,
+    workers: int = WORKERS,
+    sweep_workers: Optional[str] = SWEEP_WORKERS,
+    pool: str = POOL,
+    warmup: int = WARMUP,
+    repeats: int = REPEATS,
+    json_: Optional[Path] = JSON,
+    profile: bool = PROFILE,
+    pstats: Optional[Path] = PSTATS,
+    folded: Optional[Path] = FOLDED,
+    record: bool = RECORD,
+    memory: bool = MEMORY,
+):
     """Benchmark Meta-Code processing speed."""
-    total, files = ie.get_files(path, recursive=True)
-    out.print(ie.system_info("Content-Code"))
-    out.print(f"Benchmarking with {len(files)} files (total size: {nsize(total)}) on single core.")
-    result = speed_benchmark(files, idk.code_meta, total)
-    out.print(result)
+    run_benchmark("Meta-Code", idk.code_meta, **locals())
 
 
 @app.command()
-def iscc_code(path: Optional[Path] = typer.Argument(None)):
+def iscc_code(
+    path: Optional[Path] = PATH,
+    cache: bool = CACHE,
+    workers: int = WORKERS,
+    sweep_workers: Optional[str] = SWEEP_WORKERS,
+    pool: str = POOL,
+    warmup: int = WARMUP,
+    repeats: int = REPEATS,
+    json_: Optional[Path] = JSON,
+    profile: bool = PROFILE,
+    pstats: Optional[Path] = PSTATS,
+    folded: Optional[Path] = FOLDED,
+    record: bool = RECORD,
+    memory: bool = MEMORY,
+):
     """Benchmark ISCC-CODE processing speed."""
+    run_benchmark("ISCC-CODE", idk.code_iscc, **locals())
+
+
+#: Modules that must not be loaded by importing the CLI (they are only needed by subcommands)
+HEAVY_MODULES = (
+    "iscc_sdk",
+    "iscc_core",
+    "numpy",
+    "requests",
+    "cpuinfo",
+    "iscc_samples",
+    "pydantic",
+    "diskcache",
+)
+STARTUP_CMD = ("distance", "ISCC:EEA2IY4TJA6X5RM4", "ISCC:EEA2IY4TZA6X5RE4")
+
+
+@app.command()
+def startup(
+    repeats: int = typer.Option(10, help="Number of timed CLI invocations."),
+    max_ms: Optional[float] = typer.Option(
+        None, help="Fail if median startup time exceeds this many milliseconds."
+    ),
+):
+    """Benchmark CLI startup time and check that no heavy modules are imported eagerly."""
+    cmd = [sys.executable, "-m", "iscc_eval.cli", *STARTUP_CMD]
+    out.print("\n[bold]ISCC Performance Benchmark - CLI Startup[/bold]")
+    out.print("==========================================================================")
+    out.print(f"Command: iscc-eval {' '.join(STARTUP_CMD)}")
+    subprocess.run(cmd, check=True, capture_output=True)  # Warm filesystem caches
+    timings = []
+    for _ in range(repeats):
+        start = perf_counter()
+        subprocess.run(cmd, check=True, capture_output=True)
+        timings.append(perf_counter() - start)
+    probe = "import sys, json, iscc_eval.cli; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", probe], check=True, capture_output=True)
+    loaded = json.loads(result.stdout)
+    leaked = [m for m in HEAVY_MODULES if m in loaded]
+    median_ms = median(timings) * 1000
+    min_ms, max_ms_ = min(timings) * 1000, max(timings) * 1000
+    out.print(f"Startup: median {median_ms:.1f} ms - min {min_ms:.1f} ms - max {max_ms_:.1f} ms")
+    out.print(f"Modules: {len(loaded)} loaded by importing the CLI")
+    failed = False
+    if leaked:
+        out.print(f"[bold red]Heavy modules imported at startup: {', '.join(leaked)}")
+        failed = True
+    if max_ms is not None and median_ms > max_ms:
+        out.print(f"[bold red]Median startup time {median_ms:.1f} ms exceeds {max_ms:.1f} ms")
+        failed = True
+    if failed:
+        raise typer.Exit(1)
+
+
+@app.command()
+def load(
+    path: Optional[Path] = PATH,
+    code: str = typer.Option(
+        "content", help="Code generator (content, iscc, instance, data, meta)."
+    ),
+    concurrency: str = typer.Option(
+        "1,2,4,8,16", help="Comma separated concurrency levels (closed loop clients)."
+    ),
+    rate: Optional[str] = typer.Option(
+        None, help="Comma separated arrival rates in requests/second (open loop, replaces levels)."
+    ),
+    workers: Optional[int] = typer.Option(None, help="Executor workers (default: cpu count)."),
+    pool: str = typer.Option("process", help="Executor type (thread, process)."),
+    duration: float = typer.Option(10.0, help="Seconds of load generated per level."),
+    seed: int = typer.Option(0, help="Random seed for open loop arrival times."),
+    json_: Optional[Path] = JSON,
+    record: bool = RECORD,
+):
+    """Load test code generation with concurrent requests and report tail latency."""
+    if code not in GENERATORS:
+        raise typer.BadParameter(f"Unknown code generator {code}")
+    if pool not in POOLS:
+        raise typer.BadParameter(f"Unknown pool type {pool}")
+    func = GENERATORS[code]
+    workers = workers or os.cpu_count() or 1
+    open_loop = rate is not None
+    levels = [float(n) if open_loop else int(n) for n in (rate or concurrency).split(",")]
     total, files = ie.get_files(path, recursive=True)
-    out.print(ie.system_info("ISCC-CODE"))
-    out.print(f"Benchmarking with {len(files)} files (total size: {nsize(total)}) on single core.")
-    result = speed_benchmark(files, idk.code_iscc, total)
-    out.print(result)
+    name = f"Load {func.__name__}"
+    meta = ie.system_meta()
+    out.print(ie.system_info(name, meta))
+    out.print(
+        f"Load testing with {len(files)} files (total size: {nsize(total)}) on {workers} "
+        f"{pool} workers, {duration:.0f}s per level "
+        f"({'arrival rates' if open_loop else 'concurrency levels'} "
+        f"{', '.join(str(n) for n in levels)})."
+    )
+    result = load_benchmark(files, func, levels, open_loop, workers, pool, duration, seed)
+    out.print(load_table(result))
+    saturation = result["saturation"]
+    if saturation is None:
+        out.print("Saturation point not reached")
+    else:
+        unit = "requests/second offered" if open_loop else "concurrent requests"
+        out.print(f"Saturation point: {saturation['level']} {unit}")
+    peak = max(result["levels"], key=lambda r: r["files_per_second"])
+    out.print(
+        f"\n[bold yellow on red]Result: {peak['files_per_second']:.2f} requests/second "
+        f"(p99 {_ms(peak['latency']['p99'])} at level {peak['level']})\n"
+    )
+    if json_:
+        report = dict(system=meta, benchmark=name, function=func.__name__, result=result)
+        with open(json_, "wt", encoding="utf8") as outf:
+            json.dump(report, outf, indent=2)
+        out.print(f"Saved results to {json_}")
+    if record:
+        params = dict(
+            function=func.__name__,
+            mode="open" if open_loop else "closed",
+            levels=levels,
+            workers=workers,
+            pool=pool,
+            duration=duration,
+        )
+        metrics = dict(
+            bytes_per_second=peak["bytes_per_second"],
+            files_per_second=peak["files_per_second"],
+            load=result,
+        )
+        run_id = ie.record(
+            f"speed load {func.__name__}", params, metrics, ie.files_fingerprint(files)
+        )
+        out.print(f"Recorded results as run #{run_id} (compare with `iscc-eval history compare`)")
 
 
-def speed_benchmark(files: List[Path], func: Callable, total: Optional[int]):
-    nbytes = total or sum(file.stat().st_size for file in files)
+def run_benchmark(
+    name: str,
+    func: Callable,
+    path: Optional[Path],
+    cache: bool = False,
+    workers: int = 1,
+    sweep_workers: Optional[str] = None,
+    pool: str = "both",
+    warmup: int = 1,
+    repeats: int = 3,
+    json_: Optional[Path] = None,
+    profile: bool = False,
+    pstats: Optional[Path] = None,
+    folded: Optional[Path] = None,
+    record: bool = True,
+    memory: bool = False,
+):
+    """Run single core or multi-core scaling benchmark for code generator `func`"""
+    total, files = ie.get_files(path, recursive=True)
+    meta = ie.system_meta()
+    out.print(ie.system_info(name, meta))
+    report = dict(system=meta, benchmark=name, function=func.__name__)
+    if workers <= 1 and not sweep_workers:
+        out.print(
+            f"Benchmarking with {len(files)} files (total size: {nsize(total)}) on single core "
+            f"({warmup} warmup, {repeats} timed passes)."
+        )
+        result = speed_benchmark(files, func, total, cache, warmup, repeats)
+        print_result(result)
+    else:
+        counts = [int(n) for n in sweep_workers.split(",")] if sweep_workers else [workers]
+        pools = POOLS if pool == "both" else (pool,)
+        for pool_type in pools:
+            if pool_type not in POOLS:
+                raise typer.BadParameter(f"Unknown pool type {pool_type}")
+        out.print(
+            f"Benchmarking with {len(files)} files (total size: {nsize(total)}) "
+            f"on {', '.join(str(n) for n in counts)} workers ({', '.join(pools)} pools)."
+        )
+        result = scaling_benchmark(files, func, total, counts, pools)
+        out.print(scaling_table(result))
+    if profile or pstats or folded:
+        report["profile"] = profile_benchmark(files, func, pstats, folded)
+    if memory:
+        report["memory"] = memory_benchmark(files, func, workers)
+    if json_:
+        report["result"] = result
+        with open(json_, "wt", encoding="utf8") as outf:
+            json.dump(report, outf, indent=2)
+        out.print(f"Saved results to {json_}")
+    if record:
+        params = dict(function=func.__name__)
+        if workers <= 1 and not sweep_workers:
+            params.update(warmup=warmup, repeats=repeats)
+            run_id = record_speed(name, params, files, result)
+        else:
+            # Scaling runs make a single timed pass per worker count (no warmup passes)
+            params.update(workers=counts, pools=list(pools))
+            metrics = dict(
+                bytes_per_second=max(r["bytes_per_second"] for r in result),
+                files_per_second=max(r["files_per_second"] for r in result),
+                scaling=result,
+            )
+            run_id = ie.record(f"speed {name}", params, metrics, ie.files_fingerprint(files))
+        out.print(f"Recorded results as run #{run_id} (compare with `iscc-eval history compare`)")
+
+
+def record_speed(name: str, params: dict, files: List[Path], result: dict) -> int:
+    """Record a single core `speed_benchmark` result with per-file median latencies"""
+    per_file = result["per_file"]
+    samples = dict(
+        keys=np.array([Path(item["path"]).name for item in per_file]),
+        size=np.array([item["size"] for item in per_file], dtype=np.float64),
+        latency=np.array([np.median(item["latency"]) for item in per_file]),
+    )
+    metrics = dict(
+        bytes_per_second=result["throughput"]["bytes_per_second"],
+        files_per_second=result["throughput"]["files_per_second"],
+        latency=result["latency"],
+    )
+    return ie.record(f"speed {name}", params, metrics, ie.files_fingerprint(files), samples)
+
+
+def size_bucket(size: int) -> str:
+    """Human readable file size bucket label"""
+    for limit, label in SIZE_BUCKETS:
+        if size < limit:
+            return label
+    return f">= {nsize(SIZE_BUCKETS[-1][0])}"
+
+
+def mediatype(file: Path) -> str:
+    try:
+        return idk.mediatype_and_mode(file.as_posix())[0]
+    except Exception:
+        return "unknown"
+
+
+def latency_stats(latencies: np.ndarray) -> Dict[str, float]:
+    """Latency distribution summary in seconds"""
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return dict(
+        mean=float(latencies.mean()),
+        p50=float(p50),
+        p95=float(p95),
+        p99=float(p99),
+        max=float(latencies.max()),
+    )
+
+
+def group_stats(latencies: np.ndarray, sizes: np.ndarray, labels: List[str]) -> Dict[str, dict]:
+    """Throughput and latency per file group label"""
+    groups = {}
+    labels = np.array(labels)
+    for label in sorted(set(labels)):
+        mask = labels == label
+        group_latencies = latencies[:, mask]
+        group_bytes = int(sizes[mask].sum())
+        groups[label] = dict(
+            files=int(mask.sum()),
+            bytes=group_bytes,
+            bytes_per_second=group_bytes * len(latencies) / float(group_latencies.sum()),
+            latency=latency_stats(group_latencies.ravel()),
+        )
+    return groups
+
+
+def speed_benchmark(
+    files: List[Path],
+    func: Callable,
+    total: Optional[int],
+    cache: bool = False,
+    warmup: int = 1,
+    repeats: int = 3,
+) -> dict:
+    """
+    Time code generator `func` on `files`.
+
+    Runs `warmup` untimed passes followed by `repeats` timed passes with per-file latencies.
+    Console output and bookkeeping are kept outside of the timed region.
+    """
+    sizes = np.array([file.stat().st_size for file in files], dtype=np.int64)
+    nbytes = total or int(sizes.sum())
     nfiles = len(files)
-    with Timer(logger=None) as t:
+    fps = [str(file) for file in files]
+    for _ in range(warmup):
+        for fp in fps:
+            func(fp)
+    latencies = np.zeros((repeats, nfiles), dtype=np.float64)
+    walls = []
+    isccs = [None] * nfiles
+    for rep in range(repeats):
+        start = perf_counter()
+        for idx, fp in enumerate(fps):
+            t0 = perf_counter()
+            r = func(fp)
+            latencies[rep, idx] = perf_counter() - t0
+            isccs[idx] = r.iscc
+        walls.append(perf_counter() - start)
+
+    for file, iscc in zip(files, isccs):
+        out.print(f"Processed {file.name} -> {iscc}")
+    if cache:
+        # Cache update (incl. content hashing) stays outside of the timed loop
+        for file, iscc in zip(files, isccs):
+            ie.cache_store(file, func, iscc)
+
+    per_repeat = [nbytes / wall for wall in walls]
+    return dict(
+        files=nfiles,
+        bytes=nbytes,
+        warmup=warmup,
+        repeats=repeats,
+        throughput=dict(
+            bytes_per_second=median(per_repeat),
+            files_per_second=median(nfiles / wall for wall in walls),
+            min=min(per_repeat),
+            max=max(per_repeat),
+            stdev=pstdev(per_repeat),
+            per_repeat=per_repeat,
+        ),
+        latency=latency_stats(latencies.ravel()),
+        by_mediatype=group_stats(latencies, sizes, [mediatype(file) for file in files]),
+        by_size=group_stats(latencies, sizes, [size_bucket(size) for size in sizes]),
+        per_file=[
+            dict(path=fp, size=int(size), iscc=iscc, latency=[float(x) for x in latencies[:, idx]])
+            for idx, (fp, size, iscc) in enumerate(zip(fps, sizes, isccs))
+        ],
+    )
+
+
+def _ms(seconds: Optional[float]) -> str:
+    return "-" if seconds is None else f"{seconds * 1000:.1f} ms"
+
+
+def print_result(result: dict):
+    """Print latency breakdown tables and summary of a `speed_benchmark` result"""
+    for key, title in (("by_mediatype", "Media Type"), ("by_size", "File Size")):
+        table = Table(title=f"Latency by {title}")
+        for column in (title, "Files", "Bytes/second", "p50", "p95", "p99", "max"):
+            table.add_column(column, justify="right")
+        for label, group in result[key].items():
+            lat = group["latency"]
+            table.add_row(
+                label,
+                str(group["files"]),
+                f"{nsize(group['bytes_per_second'])}/s",
+                *(_ms(lat[k]) for k in ("p50", "p95", "p99", "max")),
+            )
+        out.print(table)
+    lat = result["latency"]
+    out.print(
+        f"Latency: p50 {_ms(lat['p50'])} - p95 {_ms(lat['p95'])} - "
+        f"p99 {_ms(lat['p99'])} - max {_ms(lat['max'])}"
+    )
+    tp = result["throughput"]
+    out.print(
+        f"\n[bold yellow on red]Result: {nsize(tp['bytes_per_second'])}/second "
+        f"(min {nsize(tp['min'])}/s - max {nsize(tp['max'])}/s) "
+        f"(with {result['files']} files)\n"
+    )
+
+
+def profile_benchmark(
+    files: List[Path], func: Callable, pstats: Optional[Path], folded: Optional[Path]
+) -> dict:
+    """Untimed pass over `files` attributing wall and CPU time to processing stages"""
+    out.print("Profiling processing stages ...")
+    profiler = ie.StageProfiler(pstats, folded)
+    profiled = profiler.wrap(func)
+    with profiler.instrument():
         for file in files:
-            r = func(str(file))
-            out.print(f"Processed {file.name} -> {r.iscc}")
-    bytes_per_second = nbytes / t.last
-    return f"\n[bold yellow on red]Result: {nsize(bytes_per_second)}/second (with {nfiles} files)\n"
+            profiled(str(file))
+    out.print(profiler.table())
+    for outfile in (pstats, folded):
+        if outfile:
+            out.print(f"Saved profile to {outfile}")
+    return dict(summary=profiler.summary(), per_file=profiler.records)
+
+
+def memory_benchmark(files: List[Path], func: Callable, workers: int = 1) -> dict:
+    """Untimed pass over `files` measuring peak memory per file in fresh worker processes"""
+    if not ie.memory_supported():
+        out.print("Memory measurement is not supported on this platform")
+        return {}
+    out.print("Measuring peak memory per file ...")
+    result = ie.memory_profile(files, func, workers)
+    out.print(f"Baseline worker peak RSS: {nsize(result['baseline'])}")
+    result["by_mode"] = ie.memory_summary(result, lambda r: r["mode"] or "unknown")
+    result["by_size"] = ie.memory_summary(result, lambda r: size_bucket(r["size"]))
+    out.print(ie.memory_table(result["by_mode"], "Mode"))
+    out.print(ie.memory_table(result["by_size"], "File Size"))
+    table = Table(title="Largest Peak Memory")
+    for column in ("File", "Size", "Peak", "Bytes/byte", "Python peak", "Top allocation"):
+        table.add_column(column, justify="right")
+    for record in sorted(result["per_file"], key=lambda r: r["peak"], reverse=True)[:5]:
+        site = record["top"][0]["site"] if record["top"] else ""
+        table.add_row(
+            Path(record["path"]).name,
+            nsize(record["size"]),
+            nsize(record["peak"]),
+            f"{record['per_byte']:.2f}",
+            nsize(record["python_peak"]),
+            site,
+        )
+    out.print(table)
+    return result
+
+
+def _code(func: Callable, fp: str) -> str:
+    """Pool task - generate code for a single file"""
+    return func(fp).iscc
+
+
+def _noop(_):
+    return None
+
+
+def _executor(pool: str, workers: int) -> Executor:
+    if pool == "process":
+        return ProcessPoolExecutor(
+            max_workers=workers, initializer=ie.opts_restore, initargs=(ie.opts_snapshot(),)
+        )
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+def pool_benchmark(files: List[Path], func: Callable, workers: int, pool: str) -> float:
+    """Process `files` with `func` on a worker pool and return elapsed seconds"""
+    fps = [str(file) for file in files]
+    with _executor(pool, workers) as executor:
+        # Start up workers before timing
+        list(executor.map(_noop, range(workers)))
+        with Timer(logger=None) as t:
+            list(executor.map(_code, [func] * len(fps), fps))
+    return t.last
+
+
+def scaling_benchmark(
+    files: List[Path], func: Callable, total: Optional[int], counts: List[int], pools
+) -> List[dict]:
+    """Measure aggregate throughput and parallel efficiency for worker `counts` per pool type"""
+    nbytes = total or sum(file.stat().st_size for file in files)
+    nfiles = len(files)
+    # Parallel efficiency is relative to single worker throughput
+    counts = sorted(set([1] + list(counts)))
+    rows = []
+    for pool in pools:
+        baseline = None
+        for workers in counts:
+            elapsed = pool_benchmark(files, func, workers, pool)
+            files_per_second = nfiles / elapsed
+            baseline = baseline or files_per_second
+            speedup = files_per_second / baseline
+            rows.append(
+                dict(
+                    pool=pool,
+                    workers=workers,
+                    bytes_per_second=nbytes / elapsed,
+                    files_per_second=files_per_second,
+                    speedup=speedup,
+                    efficiency=speedup / workers,
+                )
+            )
+    return rows
+
+
+def scaling_table(rows: List[dict]) -> Table:
+    table = Table(title="Scaling Result")
+    for column in ("Pool", "Workers", "Bytes/second", "Files/second", "Speedup", "Efficiency"):
+        table.add_column(column, justify="right")
+    for row in rows:
+        table.add_row(
+            row["pool"],
+            str(row["workers"]),
+            f"{nsize(row['bytes_per_second'])}/s",
+            f"{row['files_per_second']:.2f}",
+            f"{row['speedup']:.2f}x",
+            f"{row['efficiency']:.0%}",
+        )
+    return table
+
+
+def _timed(func: Callable, fp: str) -> tuple:
+    """Pool task - generate code for a single file and return (service seconds, error)"""
+    start = perf_counter()
+    try:
+        func(fp)
+    except Exception as e:
+        return perf_counter() - start, str(e)
+    return perf_counter() - start, None
+
+
+async def _load_level(
+    executor: Executor, func: Callable, files: List[Path], level, open_loop, duration, rng
+) -> List[tuple]:
+    """
+    Generate load for `duration` seconds.
+
+    Closed loop: `level` clients each submit their next request as soon as the previous one
+    returned. Open loop: requests arrive as a Poisson process with `level` requests per second
+    independent of completions, so queueing delay grows without bound beyond saturation.
+
+    :return: Per-request (arrival, end, service seconds, file size, error)
+    """
+    loop = asyncio.get_running_loop()
+    requests = cycle([(file.as_posix(), file.stat().st_size) for file in files])
+    records = []
+    deadline = perf_counter() + duration
+
+    async def request(arrival, fp, size):
+        service, error = await loop.run_in_executor(executor, _timed, func, fp)
+        records.append((arrival, perf_counter(), service, size, error))
+
+    async def client():
+        while perf_counter() < deadline:
+            await request(perf_counter(), *next(requests))
+
+    if not open_loop:
+        await asyncio.gather(*(client() for _ in range(level)))
+        return records
+    tasks = []
+    arrival = perf_counter()
+    while True:
+        arrival += rng.exponential(1.0 / level)
+        if arrival >= deadline:
+            break
+        await asyncio.sleep(max(arrival - perf_counter(), 0))
+        tasks.append(asyncio.ensure_future(request(arrival, *next(requests))))
+    await asyncio.gather(*tasks)
+    return records
+
+
+def load_stats(level, records: List[tuple]) -> dict:
+    """
+    Latency percentiles, queueing delay and achieved throughput of one load level.
+
+    Levels without completed requests have zero throughput and `None` latencies.
+    """
+    if not records:
+        return dict(
+            level=level,
+            requests=0,
+            errors=0,
+            elapsed=0.0,
+            offered_per_second=None,
+            files_per_second=0.0,
+            bytes_per_second=0.0,
+            latency={k: None for k in ("mean", "p50", "p90", "p99", "p999", "max")},
+            queue={k: None for k in ("mean", "p50", "p99", "growth")},
+            service={k: None for k in ("mean", "p50")},
+        )
+    arrival, end, service, size = (np.array([r[i] for r in records]) for i in range(4))
+    latency = end - arrival
+    # Time spent waiting for a free worker (incl. executor dispatch and result transfer)
+    queue = np.maximum(latency - service, 0.0)
+    elapsed = float(end.max() - arrival.min())
+    span = float(arrival.max() - arrival.min())
+    p50, p90, p99, p999 = np.percentile(latency, [50, 90, 99, 99.9])
+    q50, q99 = np.percentile(queue, [50, 99])
+    # Backlog growth - queueing delay of the last vs the first quarter of arrivals
+    by_arrival = queue[np.argsort(arrival, kind="stable")]
+    quarter = max(len(by_arrival) // 4, 1)
+    growth = float(np.median(by_arrival[-quarter:]) - np.median(by_arrival[:quarter]))
+    return dict(
+        level=level,
+        requests=len(records),
+        errors=sum(1 for r in records if r[4] is not None),
+        elapsed=elapsed,
+        offered_per_second=len(records) / span if span else None,
+        files_per_second=len(records) / elapsed,
+        bytes_per_second=float(size.sum()) / elapsed,
+        latency=dict(
+            mean=float(latency.mean()),
+            p50=float(p50),
+            p90=float(p90),
+            p99=float(p99),
+            p999=float(p999),
+            max=float(latency.max()),
+        ),
+        queue=dict(mean=float(queue.mean()), p50=float(q50), p99=float(q99), growth=growth),
+        service=dict(mean=float(service.mean()), p50=float(np.median(service))),
+    )
+
+
+def saturation_point(rows: List[dict], open_loop: bool) -> Optional[dict]:
+    """
+    Saturation point: the first arrival rate at which queueing delay grows over the level by more
+    than `SATURATION_QUEUE` median service times (open loop), or the lowest concurrency level
+    below the highest tested one that reaches `SATURATION_PEAK` of the peak throughput (closed
+    loop). Returns None if no level qualifies.
+    """
+    rows = sorted(rows, key=lambda r: r["level"])
+    if open_loop:
+        # Arrival and completion rates can not be compared directly over a finite level - requests
+        # arriving late complete after the arrival window. A growing backlog shows saturation.
+        for row in rows:
+            growth, service = row["queue"]["growth"], row["service"]["p50"]
+            if growth is not None and growth > SATURATION_QUEUE * service:
+                return row
+        return None
+    peak = max(row["files_per_second"] for row in rows)
+    for row in rows[:-1]:
+        if row["files_per_second"] >= peak * SATURATION_PEAK:
+            return row
+    return None
+
+
+def load_benchmark(
+    files: List[Path],
+    func: Callable,
+    levels: List,
+    open_loop: bool,
+    workers: int,
+    pool: str,
+    duration: float,
+    seed: int = 0,
+) -> dict:
+    """Run load levels (concurrency or arrival rate) against a shared executor"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    with _executor(pool, workers) as executor:
+        # Start up workers and warm decoders before measuring
+        list(executor.map(_noop, range(workers)))
+        list(executor.map(_timed, [func] * min(workers, len(files)), [str(f) for f in files]))
+        for level in levels:
+            args = executor, func, files, level, open_loop, duration, rng
+            records = asyncio.run(_load_level(*args))
+            rows.append(load_stats(level, records))
+    return dict(
+        mode="open" if open_loop else "closed",
+        workers=workers,
+        pool=pool,
+        duration=duration,
+        levels=rows,
+        saturation=saturation_point(rows, open_loop),
+    )
+
+
+def load_table(result: dict) -> Table:
+    open_loop = result["mode"] == "open"
+    table = Table(title="Load Test Result")
+    columns = ("Requests", "Errors", "Req/second", "Bytes/second", "p50", "p90", "p99", "p999")
+    for column in ("Rate" if open_loop else "Concurrency",) + columns + ("Queue p50", "Queue p99"):
+        table.add_column(column, justify="right")
+    for row in result["levels"]:
+        lat, queue = row["latency"], row["queue"]
+        table.add_row(
+            str(row["level"]),
+            str(row["requests"]),
+            str(row["errors"]),
+            f"{row['files_per_second']:.2f}",
+            f"{nsize(row['bytes_per_second'])}/s",
+            *(_ms(lat[k]) for k in ("p50", "p90", "p99", "p999")),
+            _ms(queue["p50"]),
+            _ms(queue["p99"]),
+        )
+    return table
 
 
 if __name__ == "__main__":
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+Compact memory-mappable columnar store for ground truth codes.
+
+File layout (all arrays 64-byte aligned)::
+
+    magic         8 bytes  b"ISCCGT01"
+    header size   4 bytes  little endian uint32
+    header        JSON     bits, mode, count, array offsets and free-form metadata
+    codes         uint8    (count, bits // 8) hash digests (sample rows first, then queries)
+    cluster       int32    (count,) cluster id per code (-1 for samples)
+    query         uint8    (count,) 1 for the query code of a cluster
+"""
+import json
+import struct
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+import blake3
+import numpy as np
+import iscc_core as ic
+from diskcache import Index
+
+
+__all__ = [
+    "GroundTruthStore",
+    "StoreWriter",
+    "store_convert",
+    "shard_of",
+    "store_merge",
+    "MatchSpill",
+    "iter_spill",
+]
+
+MAGIC = b"ISCCGT01"
+SPILL_MAGIC = b"ISCCMR01"
+ALIGN = 64
+
+
+def _align(offset):
+    # type: (int) -> int
+    return -(-offset // ALIGN) * ALIGN
+
+
+class GroundTruthStore:
+    """Read-only, memory mapped view of a ground truth store file"""
+
+    def __init__(self, path):
+        # type: (Path) -> None
+        self.path = Path(path)
+        with open(self.path, "rb") as infile:
+            if infile.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a ground truth store: {path}")
+            (size,) = struct.unpack("<I", infile.read(4))
+            self.header = json.loads(infile.read(size).decode("utf-8"))
+        count, nbytes = self.header["count"], self.header["bits"] // 8
+        offsets = self.header["offsets"]
+        self.codes = self._map(np.uint8, offsets["codes"], (count, nbytes))
+        self.cluster = self._map(np.int32, offsets["cluster"], (count,))
+        self.query = self._map(np.uint8, offsets["query"], (count,))
+
+    def _map(self, dtype, offset, shape):
+        if 0 in shape:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+    @property
+    def bits(self):
+        # type: () -> int
+        return self.header["bits"]
+
+    @property
+    def mode(self):
+        # type: () -> str
+        return self.header["mode"]
+
+    @property
+    def clusters(self):
+        # type: () -> List[str]
+        """Cluster names indexed by cluster id"""
+        return self.header.get("clusters", [])
+
+    def __len__(self):
+        return self.header["count"]
+
+    @property
+    def packed(self):
+        # type: () -> np.ndarray
+        """Zero-copy `uint64` view of all codes with shape (count, bits // 64)"""
+        return self.codes.view(np.uint64)
+
+    @property
+    def samples(self):
+        # type: () -> np.ndarray
+        """Zero-copy `uint64` view of all codes matched against (variations and samples)"""
+        return self.packed[: self.header["samples"]]
+
+    @property
+    def queries(self):
+        # type: () -> np.ndarray
+        """Zero-copy `uint64` view of cluster query codes"""
+        return self.packed[self.header["samples"] :]
+
+    @property
+    def query_rows(self):
+        # type: () -> np.ndarray
+        """Row indices of query codes"""
+        return np.flatnonzero(self.query)
+
+    @property
+    def sample_rows(self):
+        # type: () -> np.ndarray
+        """Row indices of all codes matched against (cluster variations and samples)"""
+        return np.flatnonzero(self.query == 0)
+
+    def code(self, row):
+        # type: (int) -> bytes
+        return self.codes[row].tobytes()
+
+    def info(self):
+        # type: () -> str
+        return f"Dataset has {len(self.query_rows)} queries against {len(self.sample_rows)} samples"
+
+
+class StoreWriter:
+    """Append-only builder for ground truth store files (written on `close`)"""
+
+    def __init__(self, path, mode, bits=None, **meta):
+        # type: (Path, str, Optional[int], **Any) -> None
+        self.path = Path(path)
+        self.bits = bits
+        self.mode = mode
+        self.meta = meta
+        self.clusters = []  # type: List[str]
+        self._codes = bytearray()
+        self._cluster = []  # type: List[int]
+        self._query = []  # type: List[int]
+
+    def add_cluster(self, name):
+        # type: (str) -> int
+        """Register cluster `name` and return its cluster id"""
+        self.clusters.append(name)
+        return len(self.clusters) - 1
+
+    def add(self, code, cluster=-1, query=False):
+        # type: (bytes, int, bool) -> None
+        """Add hash digest `code` (code length is taken from the first code if not set)"""
+        if self.bits is None:
+            self.bits = len(code) * 8
+        if len(code) * 8 != self.bits:
+            raise ValueError(f"Expected {self.bits}-bit code got {len(code) * 8}-bit")
+        self._codes += code
+        self._cluster.append(cluster)
+        self._query.append(int(query))
+
+    def extend(self, codes, cluster, query):
+        # type: (np.ndarray, np.ndarray, np.ndarray) -> None
+        """Add rows of hash digests `codes` (count, bits // 8) with cluster ids and query flags"""
+        if self.bits is None:
+            self.bits = codes.shape[1] * 8
+        if codes.shape[1] * 8 != self.bits:
+            raise ValueError(f"Expected {self.bits}-bit codes got {codes.shape[1] * 8}-bit")
+        self._codes += np.ascontiguousarray(codes, dtype=np.uint8).tobytes()
+        self._cluster.extend(cluster.tolist())
+        self._query.extend(query.astype(np.uint8).tolist())
+
+    def __len__(self):
+        return len(self._cluster)
+
+    def close(self):
+        # type: () -> GroundTruthStore
+        count, bits = len(self), self.bits or 64
+        query = np.array(self._query, dtype=np.uint8)
+        # Samples first so that matching can use a contiguous zero-copy slice
+        order = np.argsort(query, kind="stable")
+        codes = np.frombuffer(bytes(self._codes), dtype=np.uint8).reshape(count, bits // 8)
+        arrays = dict(
+            codes=codes[order],
+            cluster=np.array(self._cluster, dtype=np.int32)[order],
+            query=query[order],
+        )
+        header = dict(
+            self.meta,
+            bits=bits,
+            mode=self.mode,
+            count=count,
+            samples=int(count - query.sum()),
+            iscc_core=self.meta.get("iscc_core", ic.__version__),
+            clusters=self.clusters,
+        )
+        # Offsets depend on header size - iterate until stable
+        offsets = {name: 0 for name in arrays}
+        while True:
+            header["offsets"] = offsets
+            data = json.dumps(header).encode("utf-8")
+            position = _align(len(MAGIC) + 4 + len(data))
+            new_offsets = {}
+            for name, arr in arrays.items():
+                new_offsets[name] = position
+                position = _align(position + arr.nbytes)
+            if new_offsets == offsets:
+                break
+            offsets = new_offsets
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as outf:
+            outf.write(MAGIC)
+            outf.write(struct.pack("<I", len(data)))
+            outf.write(data)
+            for name, arr in arrays.items():
+                outf.write(b"\0" * (offsets[name] - outf.tell()))
+                outf.write(arr.tobytes())
+        tmp_path.replace(self.path)
+        return GroundTruthStore(self.path)
+
+
+def store_convert(db_path, out_path, mode="unknown"):
+    # type: (Path, Path, str) -> GroundTruthStore
+    """Convert legacy diskcache ground truth DB at `db_path` to a store file"""
+    gdb = Index(Path(db_path).as_posix())
+    # Previous versions did not record the iscc-core version of the codes
+    writer = StoreWriter(out_path, mode, source=Path(db_path).name, iscc_core="unknown")
+    for key, values in gdb.items():
+        if key == "samples":
+            continue
+        cid = writer.add_cluster(key.hex())
+        writer.add(key, cid, query=True)
+        for value in values:
+            writer.add(value, cid)
+    for value in gdb.get("samples", []):
+        writer.add(value)
+    return writer.close()
+
+
+def shard_of(name, shards):
+    # type: (str, int) -> int
+    """Deterministic shard index of a cluster (or top-level sample) `name`"""
+    return int(blake3.blake3(name.encode("utf-8")).hexdigest()[:16], 16) % shards
+
+
+def store_merge(paths, out_path):
+    # type: (Sequence[Path], Path) -> GroundTruthStore
+    """
+    Merge shard store files (see `match shard`) into a single ground truth store.
+
+    All shards must be present exactly once and agree on code length, mode, iscc-core version,
+    dataset fingerprint and shard count. Clusters must be assigned to their expected shard.
+    """
+    shards = [GroundTruthStore(path) for path in paths]
+    if not shards:
+        raise ValueError("No shards to merge")
+    for gdb in shards:
+        if "shard" not in gdb.header:
+            raise ValueError(f"{gdb.path} is not a shard store")
+    shards.sort(key=lambda g: g.header["shard"])
+    first = shards[0].header
+    for gdb in shards:
+        for key in ("bits", "mode", "iscc_core", "fingerprint", "shards"):
+            if gdb.header.get(key) != first.get(key):
+                raise ValueError(
+                    f"Shard {gdb.path} has {key} {gdb.header.get(key)} "
+                    f"(expected {first.get(key)} from {shards[0].path})"
+                )
+    count = first["shards"]
+    indices = [gdb.header["shard"] for gdb in shards]
+    if indices != list(range(count)):
+        missing = sorted(set(range(count)) - set(indices))
+        duplicate = sorted({i for i in indices if indices.count(i) > 1})
+        raise ValueError(f"Incomplete shard set: missing {missing} - duplicate {duplicate}")
+    meta = {k: first[k] for k in ("dataset", "fingerprint", "iscc_core") if k in first}
+    writer = StoreWriter(out_path, first["mode"], first["bits"], shards=count, **meta)
+    for gdb in shards:
+        for name in gdb.clusters:
+            if shard_of(name, count) != gdb.header["shard"]:
+                raise ValueError(f"Cluster {name} in wrong shard {gdb.path}")
+        offset = len(writer.clusters)
+        writer.clusters.extend(gdb.clusters)
+        cluster = np.where(gdb.cluster >= 0, gdb.cluster + offset, -1)
+        writer.extend(gdb.codes, cluster, gdb.query)
+    return writer.close()
+
+
+class MatchSpill:
+    """
+    Append raw per-query match results (row indices into a ground truth store) to a file.
+
+    Files with a `.jsonl` suffix get one JSON object per query. All other files use a compact
+    binary format: magic `b"ISCCMR01"` followed by records of little endian uint32 query row,
+    uint32 match count and `count` uint32 sample rows.
+    """
+
+    def __init__(self, path, gdb):
+        # type: (Path, GroundTruthStore) -> None
+        self.path = Path(path)
+        self.gdb = gdb
+        self.jsonl = self.path.suffix.lower() == ".jsonl"
+        self.file = open(self.path, "wt" if self.jsonl else "wb")
+        if not self.jsonl:
+            self.file.write(SPILL_MAGIC)
+
+    def write(self, row, matches):
+        # type: (int, np.ndarray) -> None
+        """Write sample rows `matches` for query at store row `row`"""
+        if self.jsonl:
+            cluster = self.gdb.clusters[self.gdb.cluster[row]]
+            obj = dict(row=int(row), query=self.gdb.code(row).hex(), cluster=cluster)
+            obj["matches"] = matches.tolist()
+            self.file.write(json.dumps(obj) + "\n")
+        else:
+            self.file.write(struct.pack("<II", row, len(matches)))
+            self.file.write(matches.astype("<u4").tobytes())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_spill(path):
+    # type: (Path) -> Iterator[Tuple[int, np.ndarray]]
+    """Read (query row, sample rows) records from a `MatchSpill` file"""
+    path = Path(path)
+    if path.suffix.lower() == ".jsonl":
+        with open(path, "rt", encoding="utf-8") as infile:
+            for line in infile:
+                obj = json.loads(line)
+                yield obj["row"], np.array(obj["matches"], dtype=np.int64)
+        return
+    with open(path, "rb") as infile:
+        if infile.read(len(SPILL_MAGIC)) != SPILL_MAGIC:
+            raise ValueError(f"Not a match results file: {path}")
+        while True:
+            head = infile.read(8)
+            if not head:
+                break
+            row, count = struct.unpack("<II", head)
+            yield row, np.frombuffer(infile.read(4 * count), dtype="<u4").astype(np.int64)
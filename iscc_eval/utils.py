@@ -1,13 +1,22 @@
 # -*- coding: utf-8 -*-
 import os
+import sys
+import glob
+import json
+import hashlib
+import shutil
+import mmap
+import stat
+from concurrent.futures import ThreadPoolExecutor
 from os.path import basename
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import blake3
 import iscc_core
 import platform
-import cpuinfo
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import iscc_samples
 import iscc_sdk as idk
 from rich import print
@@ -21,49 +30,90 @@ from rich.progress import (
     TimeRemainingColumn,
 )
 from loguru import logger as log
+import iscc_eval as ie
 
 
 __all__ = [
     "get_files",
     "system_info",
+    "system_meta",
+    "cpu_info",
     "download",
+    "file_checksum",
     "iter_files",
+    "expand_paths",
     "dirhash",
+    "file_hash",
+    "stat_manifest",
+    "read_json",
+    "write_json",
 ]
 
 
 def get_files(path=None, mode=None, recursive=False):
     # type: (Optional[Path],  Optional[str], bool) -> Tuple[int, list]
     """Collect relevant filepaths and total size of data for a given path"""
-    if path is None:
-        files = list(
-            f
-            for f in iscc_samples.all()
-            if f.suffix not in {".mobi", ".sqlite", ".wav", ".ogg", ".ogv"}
-        )
-    else:
-        file_iter = path.rglob("*") if recursive else path.glob("*")
-        files = [p for p in file_iter if p.is_file()]
+    if path is not None:
+        manifest = ie.scan(path, recursive)
+        files = manifest.files(mode)
+        sizes = {e.path: e.size for e in manifest}
+        return sum(sizes[fp] for fp in files), files
 
+    files = list(
+        f
+        for f in iscc_samples.all()
+        if f.suffix not in {".mobi", ".sqlite", ".wav", ".ogg", ".ogv"}
+    )
     if mode is not None:
-        filtered_files = []
-        for fp in files:
-            try:
-                mtype, file_mode = idk.mediatype_and_mode(fp.as_posix())
-            except idk.IsccUnsupportedMediatype:
-                log.debug(f"Unsupported mediatype for {fp.name}")
-                continue
-            if file_mode == mode:
-                filtered_files.append(fp)
-        files = filtered_files
+        with ThreadPoolExecutor() as executor:
+            modes = executor.map(lambda fp: ie.detect_mediatype(fp)[1], files)
+            files = [fp for fp, file_mode in zip(files, modes) if file_mode == mode]
 
     total = sum(f.stat().st_size for f in files)
     return total, files
 
 
-def system_info(name=""):
+def cpu_info():
+    # type: () -> dict
+    """CPU brand and core count (py-cpuinfo is slow - results are cached per machine)"""
+    key = "|".join((platform.node(), platform.machine(), platform.platform(), str(os.cpu_count())))
+    cache_path = ie.APP_DIR / "cpuinfo.json"
+    cache = {}
+    if cache_path.exists():
+        try:
+            cache = json.loads(cache_path.read_text(encoding="utf-8"))
+        except ValueError:
+            log.warning(f"Ignoring corrupt cpu info cache {cache_path}")
+    if key not in cache:
+        import cpuinfo
+
+        cinfo = cpuinfo.get_cpu_info()
+        cache[key] = {"brand_raw": cinfo.get("brand_raw"), "count": cinfo.get("count")}
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_text(json.dumps(cache), encoding="utf-8")
+    return cache[key]
+
+
+def system_meta():
+    # type: () -> dict
+    """Machine readable system info"""
+    cinfo = cpu_info()
+    return dict(
+        cpu=cinfo.get("brand_raw"),
+        cores=cinfo.get("count"),
+        os=platform.platform(),
+        python_implementation=platform.python_implementation(),
+        python_version=platform.python_version(),
+        python_compiler=platform.python_compiler(),
+        iscc_core=iscc_core.__version__,
+        iscc_sdk=idk.__version__,
+    )
+
+
+def system_info(name="", meta=None):
+    # type: (str, Optional[dict]) -> str
     """Printable system info"""
-    cinfo = cpuinfo.get_cpu_info()
+    meta = meta or system_meta()
     sinfo = (
         "\n[bold]ISCC Performance Benchmark - {}[/bold]\n"
         "==========================================================================\n"
@@ -75,33 +125,130 @@ def system_info(name=""):
         "==========================================================================\n"
     ).format(
         name,
-        cinfo.get("brand_raw"),
-        cinfo.get("count"),
-        platform.platform(),
-        platform.python_implementation(),
-        platform.python_version(),
-        platform.python_compiler(),
-        iscc_core.__version__,
+        meta["cpu"],
+        meta["cores"],
+        meta["os"],
+        meta["python_implementation"],
+        meta["python_version"],
+        meta["python_compiler"],
+        meta["iscc_core"],
     )
     return sinfo
 
 
-def download(url, save_to, chunk_size=1000000, force=True):
-    """Large (streaming) file download with progress output.
+def http_session(pool_size=8, retries=5):
+    # type: (int, int) -> requests.Session
+    """HTTP session with connection pool of `pool_size` and retry with backoff"""
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def file_checksum(path, algorithm="sha256", chunk_size=2**20):
+    # type: (str, str, int) -> str
+    """Hex digest of file at `path` with `algorithm` (hashlib name or blake3)"""
+    hasher = blake3.blake3() if algorithm == "blake3" else hashlib.new(algorithm)
+    with open(path, "rb") as infile:
+        for chunk in iter(lambda: infile.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def verify_checksum(path, checksum):
+    # type: (str, str) -> None
+    """Raise ValueError if file does not match `checksum` (`<algorithm>:<hexdigest>`)"""
+    algorithm, _, expected = checksum.rpartition(":")
+    actual = file_checksum(path, algorithm or "sha256")
+    if actual != expected.lower():
+        raise ValueError(f"Checksum mismatch for {path}: expected {expected} got {actual}")
+
+
+def _segments(size, segments, chunk_size):
+    # type: (int, int, int) -> List[List[int]]
+    """Split `size` bytes into up to `segments` inclusive byte ranges of at least `chunk_size`"""
+    if size <= 0:
+        return []
+    count = max(1, min(segments, size // max(chunk_size, 1)))
+    step = -(-size // count)
+    return [[start, min(start + step, size) - 1] for start in range(0, size, step)]
+
+
+#: Errors after which a segment download is resumed from the bytes already received
+RESUMABLE = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+def _fetch_segment(session, url, part, start, end, progress, tid, chunk_size, retries=5):
+    # type: (requests.Session, str, str, int, int, Progress, int, int, int) -> None
+    """Download (or resume) inclusive byte range `start`-`end` of `url` to file `part`"""
+    length = end - start + 1
+    for attempt in range(retries + 1):
+        have = os.path.getsize(part) if os.path.exists(part) else 0
+        if have >= length:
+            return
+        headers = {"Range": f"bytes={start + have}-{end}"}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=60) as r:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    raise IOError(f"Server ignored range request for {url}")
+                with open(part, "ab") as f:
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        progress.update(tid, advance=len(chunk))
+        except RESUMABLE as e:
+            if attempt == retries:
+                raise
+            log.warning(f"Resuming {basename(part)} after {e}")
+
+
+def download(url, save_to, chunk_size=1000000, force=False, checksum=None, segments=8):
+    """Large file download with parallel HTTP range segments, resume and progress output.
+
+    Segments are downloaded to `<save_to>.partNN` files (layout in `<save_to>.parts`) and
+    resumed from their current size on the next call. Servers without range support fall back
+    to a single streamed request.
 
     :param str url: download url
     :param str save_to: file path to save file
     :param int chunk_size: chunk size in bytes
     :param bool force: Force redownload even if file exists
+    :param str checksum: Expected checksum of the file as `<algorithm>:<hexdigest>`
+    :param int segments: Maximum number of parallel range requests
     """
     if force is False:
         if os.path.exists(save_to):
             log.info("Skip download for {}".format(url))
+            if checksum:
+                verify_checksum(save_to, checksum)
             return save_to
 
     log.info("Downloading %s -> %s" % (url, save_to))
-    r = requests.get(url, stream=True)
-    s = int(r.headers["Content-Length"])
+    session = http_session(segments)
+    head = session.head(url, allow_redirects=True, timeout=60)
+    head.raise_for_status()
+    url = head.url
+    size = int(head.headers.get("Content-Length", 0))
+    ranges = head.headers.get("Accept-Ranges", "").lower() == "bytes" and size > 0
+
+    layout_path = f"{save_to}.parts"
+    # Without range support the whole file is streamed into a single part
+    spans = _segments(size, segments, chunk_size) if ranges else [[0, size - 1]]
+    layout = dict(url=url, size=size, segments=spans)
+    if ranges and os.path.exists(layout_path) and not force:
+        with open(layout_path, "rt", encoding="utf-8") as infile:
+            previous = json.load(infile)
+        if previous["size"] == size:
+            layout["segments"] = previous["segments"]
+    parts = [f"{save_to}.part{idx:02d}" for idx in range(len(layout["segments"]))]
+    if force or not ranges:
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
+    with open(layout_path, "wt", encoding="utf-8") as outf:
+        json.dump(layout, outf)
 
     progress = Progress(
         TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
@@ -115,13 +262,45 @@ def download(url, save_to, chunk_size=1000000, force=True):
         TimeRemainingColumn(),
     )
 
-    with open(save_to, "wb") as f:
-        with progress:
-            tid = progress.add_task("Download", filename=basename(save_to), total=s)
-            for chunk in r.iter_content(chunk_size=chunk_size):
-                if chunk:
+    with progress:
+        have = sum(os.path.getsize(p) for p in parts if os.path.exists(p))
+        tid = progress.add_task("Download", filename=basename(save_to), total=size or None)
+        progress.update(tid, completed=have)
+        if ranges:
+            with ThreadPoolExecutor(len(parts)) as executor:
+                futures = [
+                    executor.submit(
+                        _fetch_segment, session, url, part, start, end, progress, tid, chunk_size
+                    )
+                    for part, (start, end) in zip(parts, layout["segments"])
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            with session.get(url, stream=True, timeout=60) as r, open(parts[0], "wb") as f:
+                r.raise_for_status()
+                for chunk in r.iter_content(chunk_size=chunk_size):
                     f.write(chunk)
-                    progress.update(tid, advance=chunk_size)
+                    progress.update(tid, advance=len(chunk))
+
+    # Assemble segments and verify before the file becomes visible at its final path
+    tmp_path = f"{save_to}.tmp"
+    with open(tmp_path, "wb") as outf:
+        for part in parts:
+            with open(part, "rb") as infile:
+                shutil.copyfileobj(infile, outf, chunk_size)
+    if size and os.path.getsize(tmp_path) != size:
+        raise IOError(f"Incomplete download of {url}: {os.path.getsize(tmp_path)} of {size} bytes")
+    if checksum:
+        try:
+            verify_checksum(tmp_path, checksum)
+        except ValueError:
+            for path in parts + [tmp_path, layout_path]:
+                os.remove(path)
+            raise
+    os.replace(tmp_path, save_to)
+    for path in parts + [layout_path]:
+        os.remove(path)
     return save_to
 
 
@@ -154,12 +333,146 @@ def iter_files(root, exts=None, recursive=False):
                     yield os.path.join(root, f)
 
 
-def dirhash(path: Path):
+def expand_paths(inputs, files_from=None):
+    # type: (Iterable[str], Optional[str]) -> Iterator[Path]
+    """
+    Lazily expand files, directories (recursive) and glob patterns to file paths.
+
+    :param inputs: File paths, directory paths or glob patterns
+    :param files_from: Additional file with one input per line (`-` for stdin)
+    """
+
+    def expand(item):
+        if glob.has_magic(item):
+            for match in sorted(glob.glob(item, recursive=True)):
+                yield from expand(match)
+        elif os.path.isdir(item):
+            for root, folders, files in os.walk(item):
+                folders.sort()
+                for f in sorted(files):
+                    yield Path(root, f)
+        else:
+            yield Path(item)
+
+    for item in inputs:
+        yield from expand(str(item))
+    if files_from is not None:
+        infile = sys.stdin if str(files_from) == "-" else open(files_from, "rt", encoding="utf-8")
+        try:
+            for line in infile:
+                if line.strip():
+                    yield from expand(line.strip())
+        finally:
+            if infile is not sys.stdin:
+                infile.close()
+
+
+def file_hash(path, mt_size=16777216):
+    # type: (Path, int) -> str
+    """
+    Blake3 hex digest of file content using memory mapped reads.
+
+    :param path: File path
+    :param int mt_size: Minimum file size for multithreaded hashing
+    """
+    with open(path, "rb") as infile:
+        size = os.fstat(infile.fileno()).st_size
+        if size == 0:
+            return blake3.blake3().hexdigest()
+        max_threads = blake3.blake3.AUTO if size >= mt_size else 1
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return blake3.blake3(data, max_threads=max_threads).hexdigest()
+
+
+def stat_manifest(path: Path) -> Dict[str, list]:
+    """Stat data (size, mtime_ns, inode) for all files in `path` keyed by relative posix path"""
+    manifest = {}
+    for fp in path.rglob("*"):
+        st = fp.stat()
+        if stat.S_ISREG(st.st_mode) and not fp.name.endswith(".part"):
+            manifest[fp.relative_to(path).as_posix()] = [st.st_size, st.st_mtime_ns, st.st_ino]
+    return manifest
+
+
+def read_json(path: Path) -> dict:
+    """Load a JSON cache file (empty if missing or unreadable)"""
+    try:
+        with open(path, "rt", encoding="utf8") as infile:
+            return json.load(infile)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_json(path: Path, obj) -> None:
+    """Atomically replace a JSON cache file (safe with concurrent processes)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wt", encoding="utf8") as outf:
+        json.dump(obj, outf)
+    os.replace(tmp_path, path)
+
+
+def _manifest_path(path: Path) -> Path:
+    key = blake3.blake3(path.resolve().as_posix().encode("utf-8")).hexdigest()[:16]
+    return ie.cnf.data_dir / "manifests" / f"{key}.json"
+
+
+def dirhash(
+    path: Path,
+    verify: bool = False,
+    workers: Optional[int] = None,
+    manifest: Optional[Dict[str, list]] = None,
+) -> str:
+    """
+    Fingerprint of all files in `path`.
+
+    By default the fingerprint is derived from file stat data (relative path, size, mtime, inode).
+    With `verify` it is derived from file content hashes. Content hashes are computed in parallel
+    and persisted together with the stat manifest so that later runs only rehash changed files.
+
+    :param path: Directory to fingerprint
+    :param bool verify: Fingerprint file contents instead of stat data
+    :param int workers: Number of hashing threads for verified mode (default: cpu count)
+    :param manifest: Stat data from a previous directory walk (see `iscc_eval.discovery`)
+    """
+    manifest = stat_manifest(path) if manifest is None else manifest
+    print(f"Calculating directory hash for {len(manifest)} files in {path}")
+    manifest_path = _manifest_path(path)
+    previous = read_json(manifest_path)
+    # Keep content hashes of files with unchanged stat data
+    for rel, entry in manifest.items():
+        old = previous.get(rel)
+        entry.append(old[3] if old and old[:3] == entry else None)
+
+    hasher = blake3.blake3()
+    if verify:
+        stale = [rel for rel, entry in manifest.items() if entry[3] is None]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            digests = executor.map(file_hash, (path / rel for rel in stale))
+            progress = track(zip(stale, digests), total=len(stale), description="Verifying...")
+            for rel, digest in progress:
+                manifest[rel][3] = digest
+        for rel in sorted(manifest):
+            hasher.update(f"{rel}\0{manifest[rel][3]}\n".encode("utf-8"))
+    else:
+        for rel in sorted(manifest):
+            size, mtime_ns, inode = manifest[rel][:3]
+            hasher.update(f"{rel}\0{size}\0{mtime_ns}\0{inode}\n".encode("utf-8"))
+
+    write_json(manifest_path, manifest)
+    return hasher.hexdigest()
+
+
+def legacy_dirhash(path: Path) -> str:
+    """
+    Fingerprint of all files in `path` as used for ground truth DB names by previous versions.
+
+    Hashes the concatenated contents of all files in sorted path order (reads every byte).
+    """
     read_size = 2097152
     files = sorted(f for f in path.rglob("*") if f.is_file())
     hasher = blake3.blake3()
-    print(f"Calculating directory hash for {len(files)} files in {path}")
-    for file in track(files, description="Verifying..."):
+    for file in track(files, description="Hashing..."):
         with open(file, "rb") as infile:
             data = infile.read(read_size)
             while data:
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+import iscc_eval as ie
+
+
+def test_scan_skips_partial_files(tmp_path):
+    (tmp_path / "cluster00").mkdir()
+    (tmp_path / "cluster00" / "a.wav").write_bytes(b"a")
+    (tmp_path / "cluster00" / "v_a-64000.wv.part").write_bytes(b"incomplete")
+    manifest = ie.scan(tmp_path)
+    assert [e.rel for e in manifest] == ["cluster00/a.wav"]
+    assert list(ie.stat_manifest(tmp_path)) == ["cluster00/a.wav"]
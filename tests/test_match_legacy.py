@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from diskcache import Index
+import pytest
+import iscc_eval as ie
+from iscc_eval.match import ground_truth
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    path = tmp_path / "data"
+    path.mkdir()
+    monkeypatch.setattr(ie.cnf, "data_dir", path)
+    return path
+
+
+def test_ground_truth_converts_legacy_db(tmp_path, data_dir):
+    dataset = tmp_path / "dataset"
+    (dataset / "cluster00").mkdir(parents=True)
+    for name, content in (("cluster00/a.png", b"a"), ("cluster00/b.png", b"b"), ("c.png", b"c")):
+        (dataset / name).write_bytes(content)
+    query, variation, sample = b"\x01" * 8, b"\x03" * 8, b"\xff" * 8
+    legacy_path = data_dir / f"{ie.legacy_dirhash(dataset)[:16]}_64"
+    legacy = Index(legacy_path.as_posix())
+    legacy[query] = [variation]
+    legacy["samples"] = [sample]
+    del legacy
+
+    gdb = ground_truth(dataset, 64, mode="Image")
+
+    assert gdb.path.suffix == ".gt"
+    assert gdb.header["source"] == legacy_path.name
+    assert gdb.code(gdb.query_rows[0]) == query
+    assert sorted(gdb.code(row) for row in gdb.sample_rows) == [variation, sample]
+    # The converted store is used from now on
+    assert ground_truth(dataset, 64).path == gdb.path
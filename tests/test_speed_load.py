@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import time
+import pytest
+from iscc_eval.speed import load_benchmark
+
+#: Service time of the fake code generator in seconds
+SERVICE = 0.3
+
+
+def slow_service(fp):
+    time.sleep(SERVICE)
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for idx in range(4):
+        path = tmp_path / f"file{idx}.bin"
+        path.write_bytes(b"x" * 100)
+        paths.append(path)
+    return paths
+
+
+def test_load_slow_service_not_saturated(files):
+    # Service time is 15% of the level duration - ample workers, so no rate saturates
+    result = load_benchmark(files, slow_service, [1.0, 2.0], True, 8, "thread", 2.0, seed=1)
+    assert result["saturation"] is None
+    for row in result["levels"]:
+        assert row["requests"] > 0
+        assert row["queue"]["p50"] < SERVICE
+
+
+def test_load_saturated(files):
+    # Single worker handles about 3 requests/second
+    result = load_benchmark(files, slow_service, [1.0, 10.0], True, 1, "thread", 2.0, seed=1)
+    assert result["saturation"] is not None
+    assert result["saturation"]["level"] == 10.0
+
+
+def test_load_empty_level(files):
+    result = load_benchmark(files, slow_service, [0.01], True, 1, "thread", 0.5, seed=1)
+    row = result["levels"][0]
+    assert row["requests"] == 0
+    assert row["latency"]["p99"] is None
+    assert result["saturation"] is None